@@ -1,10 +1,13 @@
 from web3 import Web3, HTTPProvider
 
+import transport
+
 
 # setting up SC addresses for retrieving balances and volatilities
 backupwss = ""
 # web3 = Web3(Web3.WebsocketProvider(backupwss, websocket_timeout=60))
-web3 = Web3(HTTPProvider(backupwss))
+# json-rpc calls go through the shared session as well (pooled + recordable)
+web3 = Web3(HTTPProvider(backupwss, session=transport.session))
 
 
 eth_abi = [
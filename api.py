@@ -1,17 +1,69 @@
-from typing import List
+import os
+import re
+import json
+import shutil
+import time
+import random
+import asyncio
+from typing import Dict, Iterator, List, Tuple, Union
+from concurrent.futures import ThreadPoolExecutor
 
-import requests
+import numpy as np
 import pandas as pd
+import pyarrow as pa
 
+import cache
+import transport
 
-def _run_query(query):
-    request = requests.post(
-        "https://api.thegraph.com/subgraphs/name/ppunky/hegic-v888",
-        json={"query": query},
+try:
+    # a lot faster than the stdlib parser on the large option pages
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
+
+
+# initial page size, adapted at runtime within these bounds (see `PageSizer`)
+page_size = 200
+min_page_size = 25
+max_page_size = 1000  # upper limit of the graph
+# a page should take about this long and not get larger than this
+target_page_seconds = 1.0
+max_page_bytes = 4_000_000
+
+# local parquet store for the incremental sync (see `sync_data`)
+store_dir = "store"
+# number of blocks we go back behind the watermark to pick up reorged samples
+reorg_rewind = 10
+
+# failed requests are retried that many times, the first retry waits ~0.5s,
+# then 1s, 2s, ... (plus jitter)
+max_retries = 5
+backoff_base = 0.5
+
+# pages of unfinished pulls (see `loop_over_pages`), removed once a pull is complete
+checkpoint_dir = os.path.join(store_dir, "checkpoints")
+
+# responses of `run_query_cached`, set `response_cache.path` to a directory to
+# also keep them on disk (survives restarts)
+response_cache = cache.TTLCache(maxsize=512)
+# default ttl (in seconds) for cached queries, a refresh window of the app is 300s
+default_ttl = 60
+
+
+def _run_query(query, variables=None, stats: dict = None):
+    """`stats` (if given) gets the response time in `seconds` and size in `bytes`"""
+    request = transport.post(
+        transport.subgraph_url,
+        json={"query": query, "variables": variables or {}},
     )
 
+    if stats is not None:
+        # `elapsed` also comes back on replayed calls, so the page sizes stay the same
+        stats["seconds"] = request.elapsed.total_seconds()
+        stats["bytes"] = len(request.content)
+
     if request.status_code == 200:
-        return request.json()
+        return json_loads(request.content)
     else:
         raise Exception(
             "Query failed to run by returning code of {}. {}".format(
@@ -20,183 +72,845 @@ def _run_query(query):
         )
 
 
-def loop_over_pages(content: str) -> List:
+class _ErrorResponse(Exception):
+    """graphql errors (which come with a 200) are raised past the cache, not stored"""
+
+    def __init__(self, response: dict):
+        super().__init__(response["errors"])
+        self.response = response
+
+
+def run_query_cached(query, variables=None, ttl: float = None, stats: dict = None):
+    """
+    same as `_run_query` but answers repeated identical queries (same normalized text and
+    variables) from `response_cache` for `ttl` seconds, afterwards the stale response is
+    served for another `ttl` seconds while it gets refreshed in the background.
+    `stats` only gets filled if the query actually went out. responses with `errors`
+    are returned but never cached. not meant for cursor pages (see `loop_over_pages`)
+    """
+
+    def fetch():
+        response = _run_query(query, variables, stats)
+        if "errors" in response:
+            raise _ErrorResponse(response)
+        return response
+
+    ttl = default_ttl if ttl is None else ttl
+    key = cache.make_key(query, variables)
+    try:
+        return response_cache.get(key, fetch, ttl)
+    except _ErrorResponse as e:
+        return e.response
+
+
+class PageSizer:
+    """
+    adapts the page size between `min_page_size` and `max_page_size`: full pages which
+    come back fast (and small) let it grow, slow or too large pages shrink it and a
+    failed request halves it. only feed it timings of responses which went over the
+    network (a cache hit would look like an instant answer)
+    """
+
+    def __init__(self, size: int = None):
+        self.size = page_size if size is None else size
+
+    def update(self, seconds: float, nbytes: int = None, n_rows: int = None):
+        too_large = nbytes is not None and nbytes > max_page_bytes
+        if seconds > 1.5 * target_page_seconds or too_large:
+            self.size = max(min_page_size, int(self.size * 0.7))
+        elif seconds < 0.5 * target_page_seconds and n_rows == self.size:
+            # only full pages tell us something about larger ones
+            if nbytes is None or nbytes < max_page_bytes / 2:
+                self.size = min(max_page_size, int(self.size * 1.5))
+
+    def failed(self) -> bool:
+        """shrinks after an error, False if it is already at the minimum"""
+        if self.size <= min_page_size:
+            return False
+        self.size = max(min_page_size, self.size // 2)
+        return True
+
+
+def _iter_samples(
+    content: str, where: dict = None, fields: List[str] = None, cursor: str = ""
+) -> Iterator[List[dict]]:
+    """
+    pages over the subgraph with a cursor on `id` (`id_gt` the last id of the
+    previous page). other than `skip` the costs per page stay flat no matter how
+    deep into the history we are. `where` is added on top of the static filters
+    (used to restrict the pull to a timestamp range). with `fields` only those
+    fields get selected. the page size adapts to the measured response times.
+    a failed page is retried (smaller, with backoff) and raised after `max_retries`
+    """
 
-    data = []
-    page_size = 0
     page = 1
+    failures = 0
+    sizer = PageSizer()
 
     x = content.split("_")[0]
+    q = queries[content] if fields is None else build_query(x, _with_keys(fields))
 
     while True:
         print("page:", page)
-        q = queries[content]
+        where_ = {**filters.get(content, {}), **(where or {}), "id_gt": cursor}
 
-        q = q.replace("skip: page_size", f"skip: {page_size}")
         try:
-            response = _run_query(q)
-            try:
-                response = response["data"]
-            except KeyError as e:
-                print(e)
-                break
-            try:
-                sample = response[x]
-                if len(sample) > 0:
-                    data.append(pd.DataFrame(sample))
-                else:
-                    break
-            except KeyError as e:
-                print(e)
-                break
-            # increase skip param
-            page_size += 200
-            page += 1
-        except:
+            stats = {}
+            response = _run_query(q, {"first": sizer.size, "where": where_}, stats)
+            sample = _get_sample(response, x)
+        except Exception as e:
+            failures += 1
+            if failures > max_retries:
+                raise
+            # large pages tend to time out, so retry smaller
+            sizer.failed()
+            delay = backoff_base * 2 ** (failures - 1) * (1 + random.random())
+            print(f"page {page} failed ({e}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+            continue
+
+        failures = 0
+        if len(sample) == 0:
             break
 
+        sizer.update(stats["seconds"], stats["bytes"], len(sample))
+        yield sample
+
+        # move the cursor to the last id of this page
+        cursor = sample[-1]["id"]
+        page += 1
+
+
+def _get_sample(response: dict, x: str) -> List[dict]:
+    """the rows of `x` in a response, raises with the graphql errors if there are none"""
+    data = response.get("data") or {}
+    if x not in data:
+        raise Exception(f"no '{x}' in response: {response.get('errors')}")
+    return data[x]
+
+
+def iter_pages(
+    content: str,
+    where: dict = None,
+    since_block: int = None,
+    as_arrow: bool = False,
+    fields: List[str] = None,
+    cursor: str = "",
+) -> Iterator[Union[pd.DataFrame, pa.RecordBatch]]:
+    """
+    yields the pages of `content` one by one as they arrive, already decoded
+    (see `_decode`), as DataFrames or with `as_arrow` as arrow record batches.
+    nothing is kept in memory, so the caller can stream to parquet or stop early
+    (and continue later from the last `id` as `cursor`) e.g.
+
+        for chunk in api.iter_pages("options"):
+            ...
+    """
+
+    where = {**(where or {}), **_since_block_filter(since_block)}
+    for sample in _iter_samples(content, where, fields, cursor):
+        df = _decode(sample, content)
+        if as_arrow:
+            yield pa.RecordBatch.from_pandas(df, preserve_index=False)
+        else:
+            yield df
+
+
+def build_query(
+    entity: str,
+    fields: List[str] = None,
+    where: dict = None,
+    order_by: str = "id",
+    order_direction: str = "asc",
+    first: int = None,
+) -> str:
+    """
+    generates the query for `entity` (see `entities`) selecting only `fields` (default:
+    all of them). `where` and `first` get inlined if given, otherwise they are left as
+    the variables `$where` / `$first` (that's what the paginators fill in)
+    """
+
+    fields = entities[entity]["fields"] if fields is None else fields
+    definitions, arguments = [], []
+
+    if first is None:
+        definitions.append("$first: Int!")
+        arguments.append("first: $first")
+    else:
+        arguments.append(f"first: {first}")
+
+    if where is None:
+        definitions.append(f"$where: {entities[entity]['type']}_filter")
+        arguments.append("where: $where")
+    else:
+        arguments.append(f"where: {_to_graphql(where)}")
+
+    arguments += [f"orderBy: {order_by}", f"orderDirection: {order_direction}"]
+
+    header = f"query ({', '.join(definitions)})" if definitions else "query"
+    selection = "\n        ".join(fields)
+
+    return f"""{header} {{
+        {entity}({', '.join(arguments)}) {{
+        {selection}
+        }}
+        }}"""
+
+
+def _to_graphql(value) -> str:
+    """python value as graphql input literal e.g. {"symbol": "ETH"} -> {symbol: "ETH"}"""
+    if isinstance(value, dict):
+        return "{" + ", ".join(f"{k}: {_to_graphql(v)}" for k, v in value.items()) + "}"
+    if isinstance(value, (list, tuple)):
+        return "[" + ", ".join(_to_graphql(v) for v in value) + "]"
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if value is None:
+        return "null"
+    if isinstance(value, str):
+        return json.dumps(value)
+    return str(value)
+
+
+def _with_keys(fields: List[str]) -> List[str]:
+    """the cursor needs `id` and the decoding/sorting `timestamp`"""
+    return ["id", "timestamp"] + [f for f in fields if f not in ["id", "timestamp"]]
+
+
+def batch_queries(
+    selections: Dict[str, str], variables: Dict[str, dict] = None
+) -> Tuple[str, dict]:
+    """
+    merges several queries (each with a single top-level field) into one document, every
+    selection gets aliased with its key and its variables prefixed with the key e.g.
+    `{"a": "query ($where: X) { options(where: $where) {...} }"}` becomes
+    `query ($a_where: X) { a: options(where: $a_where) {...} }`
+    """
+
+    variables = variables or {}
+    definitions, bodies, merged = [], [], {}
+
+    for key, query in selections.items():
+        header, body = query.split("{", 1)
+        body = body.rsplit("}", 1)[0].strip()
+
+        for name, type_ in re.findall(r"\$(\w+)\s*:\s*([\w!\[\]]+)", header):
+            body = re.sub(rf"\${name}\b", f"${key}_{name}", body)
+            definitions.append(f"${key}_{name}: {type_}")
+            merged[f"{key}_{name}"] = variables.get(key, {}).get(name)
+
+        bodies.append(f"{key}: {body}")
+
+    header = f"query ({', '.join(definitions)})" if definitions else "query"
+    document = header + " {\n" + "\n".join(bodies) + "\n}"
+
+    return document, merged
+
+
+def run_batch(
+    selections: Dict[str, str], variables: Dict[str, dict] = None, cached=False
+) -> dict:
+    """runs the merged document of `batch_queries` and splits the response per key"""
+
+    document, merged = batch_queries(selections, variables)
+    run = run_query_cached if cached else _run_query
+    response = run(document, merged)
+
+    return {key: response["data"][key] for key in selections}
+
+
+def loop_over_pages(
+    content: str, where: dict = None, fields: List[str] = None, checkpoint: str = None
+) -> List[pd.DataFrame]:
+    """
+    all pages of `content`. with `checkpoint` (a directory) every page is written there
+    together with the cursor after it, a pull which was interrupted continues from there
+    """
+
+    if checkpoint is None:
+        return list(iter_pages(content, where, fields=fields))
+
+    data, state = _load_checkpoint(checkpoint)
+    if state["done"]:
+        return data
+
+    for df in iter_pages(content, where, fields=fields, cursor=state["cursor"]):
+        df.to_parquet(os.path.join(checkpoint, f"page_{len(data):05d}.parquet"))
+        data.append(df)
+        state = {"cursor": df["id"].iloc[-1], "pages": len(data), "done": False}
+        _write_json(os.path.join(checkpoint, "state.json"), state)
+
+    _write_json(os.path.join(checkpoint, "state.json"), {**state, "done": True})
+
     return data
 
 
-def get_data(content: str) -> pd.DataFrame:
+def _load_checkpoint(path: str) -> Tuple[List[pd.DataFrame], dict]:
+    """pages and state (cursor, nb of pages, done) of a checkpoint, empty if new"""
+
+    os.makedirs(path, exist_ok=True)
+    path_state = os.path.join(path, "state.json")
+    if not os.path.exists(path_state):
+        return [], {"cursor": "", "pages": 0, "done": False}
+
+    with open(path_state) as f:
+        state = json.load(f)
+    # only the pages the state knows of (a page might have been written right before a crash)
+    data = [
+        pd.read_parquet(os.path.join(path, f"page_{i:05d}.parquet"))
+        for i in range(state["pages"])
+    ]
+    if len(data) > 0:
+        print(f"resuming from checkpoint {path} after {len(data)} pages")
+
+    return data, state
+
+
+def _write_json(path: str, data: dict):
+    """write to a temp file first, so a crash never leaves a half written file"""
+    with open(path + ".tmp", "w") as f:
+        json.dump(data, f)
+    os.replace(path + ".tmp", path)
+
+
+def get_timestamp_ranges(content: str, n: int, where: dict = None) -> List[dict]:
+    """
+    splits the timestamp domain of `content` into `n` disjoint ranges
+    (as `where` filters: timestamp_gte <= timestamp < timestamp_lt, the last one is open)
+    """
+
+    x = content.split("_")[0]
+    where = {**filters.get(content, {}), **(where or {})}
+
+    # first and last sample in one round trip
+    selections = {
+        direction: build_query(
+            x, ["timestamp"], order_by="timestamp", order_direction=direction, first=1
+        )
+        for direction in ["asc", "desc"]
+    }
+    response = run_batch(selections, {d: {"where": where} for d in selections})
+    if len(response["asc"]) == 0:
+        return []
+    bounds = [response["asc"][0]["timestamp"], response["desc"][0]["timestamp"]]
+
+    # the subgraph gives BigInts back as strings, the filters have to match that type
+    cast = type(bounds[0])
+    lo, hi = int(bounds[0]), int(bounds[1]) + 1
+    edges = np.unique(np.linspace(lo, hi, n + 1).astype(int))
+
+    ranges = [
+        {"timestamp_gte": cast(a), "timestamp_lt": cast(b)}
+        for a, b in zip(edges[:-1], edges[1:])
+    ]
+    # the last range is open, samples created while pulling (or resuming) end up there
+    del ranges[-1]["timestamp_lt"]
+
+    return ranges
+
+
+def _since_block_filter(since_block: int = None) -> dict:
+    """filter for samples created or changed at/after `since_block` (minus the rewind)"""
+    if since_block is None:
+        return {}
+    return {"_change_block": {"number_gte": max(since_block - reorg_rewind, 0)}}
+
+
+def _decode(sample: List[dict], content: str) -> pd.DataFrame:
+    """
+    builds a page straight from the raw json rows into typed columns (see `schemas`),
+    fields which aren't in the schema (ids, accounts, tx hashes) are kept as strings
+    """
+
+    schema = schemas[content.split("_")[0]]
+    fields = list(sample[0].keys())
+    columns = {}
+
+    for field in fields:
+        values = [row[field] for row in sample]
+
+        if field in schema["numeric"]:
+            # numpy parses the BigDecimal strings and turns None into NaN
+            columns[field] = np.array(values, dtype="float64")
+        elif field in schema["integer"]:
+            columns[field] = np.array(values, dtype="int64")
+        elif field in schema["timestamp"]:
+            columns[field] = pd.to_datetime(np.array(values, dtype="float64"), unit="s")
+        elif field in schema["categorical"]:
+            # fixed categories so that pages can be concatenated without losing the dtype,
+            # unknown values are added instead of being dropped
+            categories = schema["categorical"][field]
+            categories = categories + sorted(set(values) - set(categories) - {None})
+            columns[field] = pd.Categorical(values, categories=categories)
+        else:
+            columns[field] = np.array(values, dtype="object")
+
+    df = pd.DataFrame(columns)
+
+    # keep the unix timestamp
+    df["timestamp_unix"] = np.array([row["timestamp"] for row in sample], dtype="int64")
+
+    if "period" in df.columns:
+        # map the period column (in seconds) to integer
+        df["period_days"] = df["period"].map(duration_mapping)
+
+    return df
+
+
+def _restore_categoricals(df: pd.DataFrame, content: str) -> pd.DataFrame:
+    """concat falls back to object if the categories of two pages differ"""
+    schema = schemas[content.split("_")[0]]
+    for field in schema["categorical"]:
+        if field in df.columns and df[field].dtype.name != "category":
+            df[field] = df[field].astype("category")
+    return df
+
+
+def get_latest_block() -> int:
+    """latest block the subgraph has indexed"""
+    response = _run_query(meta_query)
+    return int(response["data"]["_meta"]["block"]["number"])
+
+
+def changed_since(contents: List[str], since_block: int = None) -> Tuple[bool, int]:
+    """
+    cheap probe (one round trip) whether any sample of `contents` was created or changed
+    after `since_block`, together with the latest indexed block to probe from next time
+    """
+
+    selections = {"meta": meta_query}
+    variables = {}
+    for content in contents:
+        selections[content] = build_query(content.split("_")[0], ["id"], first=1)
+        variables[content] = {
+            "where": {
+                **filters.get(content, {}),
+                "_change_block": {"number_gte": (since_block or 0) + 1},
+            }
+        }
+
+    response = run_batch(selections, variables)
+    block = int(response["meta"]["block"]["number"])
+    changed = since_block is None or any(len(response[c]) > 0 for c in contents)
+
+    return changed, block
+
+
+def get_data(
+    content: str,
+    workers: int = 4,
+    since_block: int = None,
+    fields: List[str] = None,
+    checkpoint: bool = False,
+) -> pd.DataFrame:
+    """
+    pulls all samples for `content`. with `workers` > 1 the timestamp domain gets split
+    into that many ranges which are fetched at the same time and merged back in order.
+    with `since_block` only samples which were created or changed at/after that block
+    (minus `reorg_rewind` blocks) are pulled. `fields` restricts the selected columns
+    (`id` and `timestamp` are always selected). with `checkpoint` the pages are kept on
+    disk until the pull is complete, calling it again after a crash resumes the pull
+    """
 
     print(f"pulling '{content}'-data")
-    data = loop_over_pages(content)
+    where = _since_block_filter(since_block)
+
+    path = None
+    if checkpoint:
+        key = cache.make_key(content, {"where": where, "fields": fields, "n": workers})
+        path = os.path.join(checkpoint_dir, key)
+
+    if workers > 1:
+        ranges = _get_ranges(content, workers, where, path)
+        paths = [
+            None if path is None else os.path.join(path, str(i))
+            for i in range(len(ranges))
+        ]
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(
+                executor.map(
+                    lambda r, p: loop_over_pages(content, {**where, **r}, fields, p),
+                    ranges,
+                    paths,
+                )
+            )
+        data = [page for pages in results for page in pages]
+    else:
+        data = loop_over_pages(content, where, fields, path)
+
+    df = _merge_pages(data, content)
+
+    if path is not None:
+        shutil.rmtree(path, ignore_errors=True)
+
+    return df
+
+
+def _get_ranges(content: str, n: int, where: dict, path: str = None) -> List[dict]:
+    """`get_timestamp_ranges`, a checkpointed pull keeps using the ranges it started with"""
+
+    if path is None:
+        return get_timestamp_ranges(content, n, where)
+
+    path_ranges = os.path.join(path, "ranges.json")
+    if os.path.exists(path_ranges):
+        with open(path_ranges) as f:
+            return json.load(f)["ranges"]
+
+    ranges = get_timestamp_ranges(content, n, where)
+    os.makedirs(path, exist_ok=True)
+    _write_json(path_ranges, {"ranges": ranges})
+
+    return ranges
+
+
+def _merge_pages(data: List[pd.DataFrame], content: str) -> pd.DataFrame:
+    """concats the decoded pages of one or more ranges into one chronological frame"""
+
+    if len(data) == 0:
+        return pd.DataFrame()
+
     df = pd.concat(data).reset_index(drop=True)
+    df = _restore_categoricals(df, content)
+    # an option can show up in two ranges if it changed during the pull, keep the latest one
+    df = df.drop_duplicates("id", keep="last").reset_index(drop=True)
 
-    # keep the unix timestamp
-    df["timestamp_unix"] = df["timestamp"]
+    # pages come in ordered by id, restore the chronological order
+    df = df.sort_values(["timestamp", "id"], kind="mergesort").reset_index(drop=True)
+
+    return df
+
+
+def sync_data(
+    content: str, workers: int = 4, fields: List[str] = None, block: int = None
+) -> pd.DataFrame:
+    """
+    incremental version of `get_data`: keeps all samples of `content` in a local parquet
+    store and only pulls what was created or changed since the last sync (the watermark
+    block), then upserts those samples by `id`. the first call does a full pull (with
+    `workers` ranges), the small deltas after it are pulled in one range. `block` is
+    the latest indexed block if the caller just read it (e.g. from `changed_since`).
+    a store should always be synced with the same `fields`
+    """
+
+    path = os.path.join(store_dir, f"{content}.parquet")
+    path_watermark = os.path.join(store_dir, f"{content}.json")
+
+    since_block = None
+    if os.path.exists(path) and os.path.exists(path_watermark):
+        df = pd.read_parquet(path)
+        with open(path_watermark) as f:
+            since_block = json.load(f)["block"]
+
+    # read the block before the pull, anything indexed while pulling is picked up next time
+    block = get_latest_block() if block is None else block
+    if since_block is None:
+        # a resumed first pull keeps the block it started at, samples on its checkpointed
+        # pages might have changed since and are pulled again by the next sync
+        path_block = os.path.join(checkpoint_dir, f"{content}_block.json")
+        if os.path.exists(path_block):
+            with open(path_block) as f:
+                block = json.load(f)["block"]
+        else:
+            os.makedirs(checkpoint_dir, exist_ok=True)
+            _write_json(path_block, {"block": block})
+
+    delta = get_data(
+        content,
+        # a delta is a few pages at most, ranges would only add round trips
+        workers=workers if since_block is None else 1,
+        since_block=since_block,
+        fields=fields,
+        checkpoint=since_block is None,  # the first pull is the long one
+    )
+
+    if since_block is None:
+        df = delta
+    elif len(delta) > 0:
+        df = (
+            pd.concat([df, delta])
+            .drop_duplicates("id", keep="last")
+            .sort_values(["timestamp", "id"], kind="mergesort")
+            .reset_index(drop=True)
+        )
+    print(
+        f"synced '{content}': {len(delta)} new/changed samples since block {since_block}"
+    )
+
+    # temp file + rename, a crash while writing must not leave a corrupt store behind.
+    # the store goes first, a watermark behind it only pulls a few samples again
+    os.makedirs(store_dir, exist_ok=True)
+    df.to_parquet(path + ".tmp")
+    os.replace(path + ".tmp", path)
+    _write_json(path_watermark, {"block": block})
+    if since_block is None:
+        os.remove(path_block)
+
+    return df
+
+
+class TokenBucket:
+    """
+    rate limit for the async client: `rate` requests per second with bursts of up to
+    `capacity`. shared by all coroutines of an event loop (no awaits between check and take)
+    """
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            self.tokens = min(
+                self.capacity, self.tokens + (now - self.updated) * self.rate
+            )
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+# shared budget of the async client towards the indexer
+rate_limit = TokenBucket(rate=10, capacity=20)
+
+
+async def _get_sample_async(
+    q: str, x: str, where: dict, sizer: PageSizer, stats: dict
+) -> List[dict]:
+    """
+    one page of `x` (`_run_query` on the pooled transport, in the default executor).
+    every attempt takes a token from `rate_limit`, failed attempts (graphql errors
+    included) are retried smaller with exponential backoff and raised after `max_retries`
+    """
+    loop = asyncio.get_running_loop()
+
+    for attempt in range(max_retries + 1):
+        await rate_limit.acquire()
+        try:
+            variables = {"first": sizer.size, "where": where}
+            response = await loop.run_in_executor(None, _run_query, q, variables, stats)
+            return _get_sample(response, x)
+        except Exception as e:
+            if attempt == max_retries:
+                raise
+            # large pages tend to time out, so retry smaller
+            sizer.failed()
+            delay = backoff_base * 2**attempt * (1 + random.random())
+            print(f"query failed ({e}), retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+
+async def _loop_over_pages_async(
+    content: str, where: dict = None, fields: List[str] = None
+) -> List[pd.DataFrame]:
+    """async version of `loop_over_pages`, errors are raised after the retries"""
+
+    data = []
+    cursor = ""
+    sizer = PageSizer()
+    x = content.split("_")[0]
+    q = queries[content] if fields is None else build_query(x, _with_keys(fields))
+
+    while True:
+        where_ = {**filters.get(content, {}), **(where or {}), "id_gt": cursor}
+        stats = {}
+        sample = await _get_sample_async(q, x, where_, sizer, stats)
+        if len(sample) == 0:
+            break
+        sizer.update(stats["seconds"], stats["bytes"], len(sample))
+        data.append(_decode(sample, content))
+        cursor = sample[-1]["id"]
 
-    if "options" in content:
-        cols = [
+    return data
+
+
+async def get_data_async(
+    content: str,
+    workers: int = 4,
+    since_block: int = None,
+    fields: List[str] = None,
+) -> pd.DataFrame:
+    """
+    async version of `get_data`: the `workers` timestamp ranges are fetched as concurrent
+    coroutines which share the `rate_limit` budget
+    """
+
+    print(f"pulling '{content}'-data (async)")
+    loop = asyncio.get_running_loop()
+    where = _since_block_filter(since_block)
+
+    if workers > 1:
+        ranges = await loop.run_in_executor(
+            None, get_timestamp_ranges, content, workers, where
+        )
+    else:
+        ranges = [{}]
+
+    results = await asyncio.gather(
+        *[_loop_over_pages_async(content, {**where, **r}, fields) for r in ranges]
+    )
+    data = [page for pages in results for page in pages]
+
+    return _merge_pages(data, content)
+
+
+async def gather(*contents: str, **kwargs) -> List[pd.DataFrame]:
+    """
+    pulls several entities at the same time e.g.
+
+        options, balances = asyncio.run(api.gather("options", "poolBalances"))
+    """
+    return await asyncio.gather(
+        *[get_data_async(content, **kwargs) for content in contents]
+    )
+
+
+# entities of the subgraph with all of their fields, the queries get generated from this
+entities = {
+    "options": {
+        "type": "Option",
+        "fields": [
+            "id",
+            "account",
+            "symbol",
+            "status",
+            "strike",
             "amount",
             "lockedAmount",
+            "timestamp",
+            "period",
+            "expiration",
+            "type",
             "premium",
             "settlementFee",
-            "strike",
             "totalFee",
+            "exercise_timestamp",
+            "exercise_tx",
             "profit",
             "impliedVolatility",
-        ]
-        df[cols] = df[cols].astype("float64")
+            "block",
+        ],
+    },
+    "poolBalances": {
+        "type": "PoolBalance",
+        "fields": [
+            "id",
+            "timestamp",
+            "account",
+            "symbol",
+            "type",
+            "amount",
+            "tokens",
+            "availableBalance",
+            "totalBalance",
+            "currentRatio",
+        ],
+    },
+    "bondingCurveEvents": {
+        "type": "BondingCurveEvent",
+        "fields": [
+            "id",
+            "timestamp",
+            "account",
+            "type",
+            "tokenAmount",
+            "ethAmount",
+            "bondingCurveSoldAmount",
+        ],
+    },
+}
 
-        for col in ["expiration", "timestamp", "exercise_timestamp"]:
-            df[col] = pd.to_datetime(df[col], unit="s")
+queries = {
+    "options_active": build_query("options"),
+    "options": build_query("options"),
+    "poolBalances": build_query("poolBalances"),
+    "poolBalances_latest_WBTC": build_query(
+        "poolBalances",
+        ["symbol", "availableBalance", "totalBalance"],
+        where={"symbol": "WBTC", "type": "PROVIDE"},
+        order_by="timestamp",
+        order_direction="desc",
+        first=1,
+    ),
+    "poolBalances_latest_ETH": build_query(
+        "poolBalances",
+        ["symbol", "availableBalance", "totalBalance"],
+        where={"symbol": "ETH", "type": "PROVIDE"},
+        order_by="timestamp",
+        order_direction="desc",
+        first=1,
+    ),
+    "bondingCurveEvents": build_query("bondingCurveEvents"),
+}
 
-        # map the period column (in seconds) to integer
-        duration_mapping = {
-            86400: 1,
-            604800: 7,
-            1209600: 14,
-            1814400: 21,
-            2419200: 28,
-        }
-        df["period_days"] = df["period"].map(duration_mapping)
-        df["block"] = df["block"].astype(int)
+# static filters per query, the pagination cursor (`id_gt`) gets added on top
+filters = {
+    "options_active": {"status": "ACTIVE"},
+}
 
-    elif content == "poolBalances":
-        df["timestamp"] = pd.to_datetime(df["timestamp"], unit="s")
-        cols = [
+# declared types per entity, used by `_decode` to build typed pages
+schemas = {
+    "options": {
+        "numeric": [
+            "amount",
+            "lockedAmount",
+            "premium",
+            "settlementFee",
+            "strike",
+            "totalFee",
+            "profit",
+            "impliedVolatility",
+        ],
+        "integer": ["period", "block"],
+        "timestamp": ["expiration", "timestamp", "exercise_timestamp"],
+        "categorical": {
+            "symbol": ["ETH", "WBTC"],
+            "type": ["CALL", "PUT"],
+            "status": ["ACTIVE", "EXERCISED", "EXPIRED"],
+        },
+    },
+    "poolBalances": {
+        "numeric": [
             "amount",
             "availableBalance",
             "currentRatio",
             "tokens",
             "totalBalance",
-        ]
-        df[cols] = df[cols].astype("float64")
-
-    else:
-        df["timestamp"] = pd.to_datetime(df["timestamp"], unit="s")
-        cols = ["bondingCurveSoldAmount", "ethAmount", "tokenAmount"]
-        df[cols] = df[cols].astype("float64")
-
-    return df
+        ],
+        "integer": [],
+        "timestamp": ["timestamp"],
+        "categorical": {
+            "symbol": ["ETH", "WBTC"],
+            "type": ["PROVIDE", "WITHDRAW"],
+        },
+    },
+    "bondingCurveEvents": {
+        "numeric": ["bondingCurveSoldAmount", "ethAmount", "tokenAmount"],
+        "integer": [],
+        "timestamp": ["timestamp"],
+        "categorical": {
+            "type": ["BUY", "SELL"],
+        },
+    },
+}
 
+# map the period column (in seconds) to integer
+duration_mapping = {
+    86400: 1,
+    604800: 7,
+    1209600: 14,
+    1814400: 21,
+    2419200: 28,
+}
 
-queries = {
-    "options_active": """{
-        options(where: {status: "ACTIVE"}, first: 200, skip: page_size, orderBy: timestamp, orderDirection: asc) {
-        id
-        account
-        symbol
-        status
-        strike
-        amount
-        lockedAmount
-        timestamp
-        period
-        expiration
-        type
-        premium
-        settlementFee
-        totalFee
-        exercise_timestamp
-        exercise_tx
-        profit
-        impliedVolatility
-        block
-        }
-        }""",
-    "options": """{
-        options(first: 200, skip: page_size, orderBy: timestamp, orderDirection: asc) {
-        id
-        account
-        symbol
-        status
-        strike
-        amount
-        lockedAmount
-        timestamp
-        period
-        expiration
-        type
-        premium
-        settlementFee
-        totalFee
-        exercise_timestamp
-        exercise_tx
-        profit
-        impliedVolatility
-        block
-        }
-        }""",
-    "poolBalances": """{ 
-        poolBalances(first: 200, skip: page_size, orderBy: timestamp, orderDirection: asc) {
-        id
-        timestamp
-        account
-        symbol
-        type
-        amount
-        tokens
-        availableBalance
-        totalBalance
-        currentRatio
+meta_query = """{
+        _meta {
+        block {
+        number
         }
-        }""",
-    "poolBalances_latest_WBTC": """{ 
-        poolBalances(where: {symbol: "WBTC", type: "PROVIDE"}, first: 1, orderBy: timestamp, orderDirection: desc) {
-        symbol
-        availableBalance
-        totalBalance
         }
-        }""",
-    "poolBalances_latest_ETH": """{ 
-        poolBalances(where: {symbol: "ETH", type: "PROVIDE"}, first: 1, orderBy: timestamp, orderDirection: desc) {
-        symbol
-        availableBalance
-        totalBalance
-        }
-        }""",
-    "bondingCurveEvents": """{ 
-        bondingCurveEvents(first: 200, skip: page_size, orderBy: timestamp, orderDirection: asc) {
-        id
-        timestamp
-        account
-        type
-        tokenAmount
-        ethAmount
-        bondingCurveSoldAmount
-        }
-        }""",
-}
+        }"""
@@ -12,22 +12,79 @@ import numpy as np
 import pandas as pd
 
 import api
+import cube
+import filter_index
 import prepare_data
 import plots
+import prices
+import transport
+
+
+# the option fields the app actually uses (skips e.g. `exercise_tx`, `lockedAmount`)
+option_fields = [
+    "account",
+    "symbol",
+    "status",
+    "strike",
+    "amount",
+    "timestamp",
+    "period",
+    "expiration",
+    "type",
+    "premium",
+    "settlementFee",
+    "totalFee",
+    "exercise_timestamp",
+    "profit",
+    "impliedVolatility",
+]
+
+
+class Snapshot(typing.NamedTuple):
+    """
+    everything the callbacks read, published at once and never modified afterwards.
+    a callback reads `data` once, so its frame, index, cube and version always match
+    """
+
+    df: pd.DataFrame
+    index: filter_index.FilterIndex
+    cube: cube.PnLCube
+    balances: pd.DataFrame
+    version: int
+
 
+def get_new_data(block: int = None):
+    """Updates the global variable 'data' with new data (`block` see `api.sync_data`)"""
+    # incremental: only options created/changed since the last refresh get pulled
+    X = api.sync_data("options", fields=option_fields, block=block)
+    X = X[X["status"] == "ACTIVE"]
 
-def get_new_data():
-    """Updates the global variable 'df' with new data"""
-    global df, balances
-    df = api.get_data("options_active")
+    balances_new = prepare_data.get_pool_balances()
+    update_prices(X, balances_new)
+
+
+def update_prices(X: pd.DataFrame = None, balances_new: pd.DataFrame = None):
+    """
+    recomputes everything which depends on the spot prices (profit, ITM/OTM, index, cube)
+    for the active options `X`, for the ones of the last pull if None (no subgraph call)
+    """
+    global data, df_active
+    X = df_active if X is None else X
+    balances_new = data.balances if balances_new is None else balances_new
 
     # the status from the subgraph data will only change if
     # unlock and unlockAll API is called. this is currently done manually!
     # to address this I check for it and set samples with active status
     # but expiration in the past (smaller than timestamp utc now) to EXPIRED
-    df = df[df["expiration"] >= pd.Timestamp.utcnow().tz_localize(None)]
-    df = prepare_data.get_projected_profit(df)
-    balances = prepare_data.get_pool_balances()
+    X = X[X["expiration"] >= pd.Timestamp.utcnow().tz_localize(None)]
+    # compact frame (categoricals, option number, float32) for the callbacks
+    X_compact = prepare_data.compact(prepare_data.get_projected_profit(X))
+    X_index = prepare_data.get_filter_index(X_compact)
+    X_cube = prepare_data.get_pnl_cube(X_compact, X_index)
+    # only publish once everything went through, the version goes with the data
+    # (the memoized views/charts of the callbacks are keyed by it)
+    data = Snapshot(X_compact, X_index, X_cube, balances_new, data.version + 1)
+    df_active = X
 
 
 def get_historical_oi():
@@ -40,10 +97,15 @@ def get_historical_oi():
 def update_expanding_oi():
     global df_oi, dict_oi_expanding
 
-    today = pd.to_datetime("today").normalize()
-    df["amount_usd"] = df["amount"] * df["current_price"]
-    df["date"] = today
-    X = df.groupby(["date", "symbol"])[["amount", "amount_usd"]].sum().reset_index()
+    # utc like the subgraph timestamps of the historical OI (and `refresh_needed`)
+    today = pd.Timestamp.utcnow().tz_localize(None).normalize()
+    df = data.df
+    df = df.assign(amount_usd=df["amount"] * df["current_price"], date=today)
+    X = (
+        df.groupby(["date", "symbol"], observed=True)[["amount", "amount_usd"]]
+        .sum()
+        .reset_index()
+    )
 
     dict_oi_expanding[today] = X
 
@@ -51,12 +113,42 @@ def update_expanding_oi():
     df_oi = pd.concat([df_oi_hist, df_oi_expanding]).reset_index(drop=True)
 
 
+def refresh_needed() -> typing.Tuple[bool, int]:
+    """
+    a refresh is only needed if the subgraph indexed a new/changed option or pool balance
+    since the last refresh, an active option expired or a new day started (OI)
+    """
+
+    changed, block = api.changed_since(["options", "poolBalances"], last_refresh_block)
+    now = pd.Timestamp.utcnow().tz_localize(None)
+    df = data.df
+    expired = len(df) > 0 and df["expiration"].min() < now
+    new_day = now.normalize() not in dict_oi_expanding
+
+    return changed or expired or new_day, block
+
+
 def get_new_data_every(period=300):
-    """Update the data every 300 seconds"""
+    """Update the prices every 300 seconds (the options if they changed upstream)"""
+    global last_refresh_block
     while True:
-        get_new_data()
-        update_expanding_oi()
-        print("data updated")
+        try:
+            # fresh spot prices for the price stage (and the callbacks)
+            prices.refresh_spot_prices()
+            needed, block = refresh_needed()
+            if needed:
+                get_new_data(block)
+                update_expanding_oi()
+                last_refresh_block = block
+                print("data updated", transport.connection_stats())
+            else:
+                # the prices move anyways, only the subgraph pull is skipped
+                update_prices()
+                update_expanding_oi()
+                print(f"nothing changed up to block {block}, prices updated")
+        except Exception as e:
+            # pulls raise instead of returning partial data, keep serving the last data
+            print("data update failed:", e)
         time.sleep(period)
 
 
@@ -136,6 +228,40 @@ def make_layout():
                                     "Deciles 0-1 covers the lowest 10% of options, deciles 9-10 the top 10% of options etc."
                                 )
                             ),
+                            html.Div(html.H2("PRICE SCENARIOS (PCT-CHANGE)")),
+                            html.Div(
+                                className="div-for-slider",
+                                children=[
+                                    dcc.RangeSlider(
+                                        id="shock-range",
+                                        min=-90,
+                                        max=200,
+                                        step=5,
+                                        marks={
+                                            int(i): f"{i}%"
+                                            for i in np.arange(-90, 201, 30)
+                                        },
+                                        value=[-50, 50],
+                                        allowCross=False,
+                                        className="dropdown_selector",
+                                    ),
+                                ],
+                            ),
+                            html.Div(
+                                className="div-for-dropdown",
+                                children=[
+                                    dcc.Dropdown(
+                                        id="shock-step",
+                                        options=[
+                                            {"label": f"{i}% steps", "value": i}
+                                            for i in [0.5, 1, 2, 5]
+                                        ],
+                                        value=1,  # default
+                                        clearable=False,
+                                        className="dropdown_selector",
+                                    ),
+                                ],
+                            ),
                             html.Div(html.H2("SEARCH BY OPTION ID or ACCOUNT")),
                             html.Div(
                                 className="div-for-input",
@@ -249,8 +375,11 @@ app = dash.Dash(
 # for gunicorn
 server = app.server
 
-# get initial data
-get_new_data()
+# get initial data (and remember up to which block, to skip no-op refreshes)
+_, last_refresh_block = api.changed_since(["options", "poolBalances"])
+# the version is bumped with every refresh (of the options or the prices)
+data = Snapshot(pd.DataFrame(), None, None, None, 0)
+get_new_data(last_refresh_block)
 
 # calculate historical OI (we do this once, and then append the current day whos values
 # get updated every 5min)
@@ -283,19 +412,19 @@ def chart2d_bubble(
     _,
 ):
 
-    global df
-    X = df.copy()
+    snapshot = data
 
+    # the filtered options are shared with the other charts (see `filter_options`)
     X, bubble_size, current_price, current_iv = prepare_data.prepare_bubble(
-        X, symbol, period, amounts
+        snapshot.df,
+        symbol,
+        period,
+        amounts,
+        snapshot.index,
+        id_,
+        snapshot.version,
     )
 
-    if id_ is not None and len(id_) > 0:
-        if len(id_) >= 40:
-            X = X[X["Account"].str.lower() == id_.lower()]
-        else:
-            X = X[X["Option ID"] == id_]
-
     fig = plots.plot_bubble(
         X=X,
         bubble_size=bubble_size,
@@ -327,12 +456,21 @@ def chart2d_pnl(
     _,
 ):
 
-    global df, balances
-    X = df.copy()
+    snapshot = data
 
-    agg = prepare_data.prepare_pnl(X, symbol, period, amounts, relayoutData, id_)
+    agg = prepare_data.prepare_pnl(
+        snapshot.df,
+        symbol,
+        period,
+        amounts,
+        relayoutData,
+        id_,
+        snapshot.cube,
+        snapshot.index,
+        snapshot.version,
+    )
 
-    fig = plots.plot_pnl(agg=agg, balances=balances, symbol=symbol)
+    fig = plots.plot_pnl(agg=agg, balances=snapshot.balances, symbol=symbol)
 
     return fig
 
@@ -349,9 +487,7 @@ def chart2d_balance(
     _,
 ):
 
-    global balances
-
-    fig = plots.plot_pool_balance(balances, symbol)
+    fig = plots.plot_pool_balance(data.balances, symbol)
 
     return fig
 
@@ -368,9 +504,7 @@ def chart2d_putcall(
     _,
 ):
 
-    global df
-
-    fig = plots.plot_put_call_ratio(df, symbol)
+    fig = plots.plot_put_call_ratio(data.df, symbol)
 
     return fig
 
@@ -382,6 +516,8 @@ def chart2d_putcall(
         Input("symbol", "value"),
         Input("period", "value"),
         Input("amounts", "value"),
+        Input("shock-range", "value"),
+        Input("shock-step", "value"),
         Input("invisible-div-callback-trigger", "children"),
     ],
 )
@@ -390,18 +526,29 @@ def chart2d_pnl_pct_change(
     symbol: str,
     period: str,
     amounts: typing.List[int],
+    shock_range: typing.List[int],
+    shock_step: float,
     _,
 ):
 
-    global df, balances
+    snapshot = data
+
+    # the slider/dropdown are in pct
+    shocks = prepare_data.shock_grid(
+        shock_range[0] / 100, shock_range[1] / 100, shock_step / 100
+    )
 
     X, current_price = prepare_data.prepare_pnl_pct_changes(
-        df,
-        balances,
+        snapshot.df,
+        snapshot.balances,
         relayoutData,
         symbol,
         period,
         amounts,
+        shocks=shocks,
+        data_version=snapshot.version,
+        pnl_cube=snapshot.cube,
+        index=snapshot.index,
     )
     fig = plots.plot_pnl_pct_change(X, current_price)
 
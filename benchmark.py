@@ -0,0 +1,142 @@
+"""
+ingest benchmark against the local fake subgraph (see `fake_subgraph.py`), reports
+rows/sec, peak rss and the number of requests for each ingest mode e.g.
+
+    python benchmark.py --options 100000 --latency 0.02
+
+every mode runs in its own process, so that the peak rss is not shared between them
+"""
+
+import io
+import sys
+import json
+import time
+import asyncio
+import argparse
+import resource
+import subprocess
+import contextlib
+
+import pandas as pd
+
+import api
+import transport
+import fake_subgraph
+
+
+def _pull_skip(content: str) -> pd.DataFrame:
+    """the old `skip` pagination (fixed pages of 200, ordered by timestamp) as baseline"""
+
+    x = content.split("_")[0]
+    q = (
+        api.queries[content]
+        .replace(f"$where: {api.entities[x]['type']}_filter", "$skip: Int!")
+        .replace("where: $where", "skip: $skip")
+        .replace("orderBy: id", "orderBy: timestamp")
+    )
+
+    data, skip = [], 0
+    while True:
+        sample = api._run_query(q, {"first": 200, "skip": skip})["data"][x]
+        if len(sample) == 0:
+            break
+        data.append(api._decode(sample, content))
+        skip += 200
+
+    return pd.concat(data).reset_index(drop=True)
+
+
+def _stream(content: str) -> int:
+    return sum(len(chunk) for chunk in api.iter_pages(content))
+
+
+modes = {
+    "skip": _pull_skip,
+    "sequential": lambda content: api.get_data(content, workers=1),
+    "parallel": lambda content: api.get_data(content, workers=4),
+    "async": lambda content: asyncio.run(api.gather(content))[0],
+    "stream": _stream,
+}
+
+
+def run_mode(mode: str, content: str, url: str) -> dict:
+    """runs one mode (in this process) and returns rows, seconds and peak rss"""
+
+    transport.subgraph_url = url
+
+    start = time.perf_counter()
+    # the paginators print every page
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = modes[mode](content)
+    seconds = time.perf_counter() - start
+
+    rows = result if isinstance(result, int) else len(result)
+    # kilobytes on linux
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    return {"rows": rows, "seconds": seconds, "peak_rss_mb": peak_rss}
+
+
+def run_benchmark(
+    content: str = "options",
+    n_options: int = 100000,
+    latency: float = 0.02,
+    skip_cost: float = 0.0,
+    selected_modes: list = None,
+) -> pd.DataFrame:
+
+    n_other = max(n_options // 10, 1)
+    data = fake_subgraph.make_data(n_options, n_other, n_other)
+    subgraph = fake_subgraph.Subgraph(data, latency, skip_cost)
+    server = fake_subgraph.serve(subgraph)
+
+    results = []
+    for mode in selected_modes or list(modes):
+        subgraph.reset_stats()
+        out = subprocess.run(
+            [sys.executable, __file__, "--run", mode, "--content", content],
+            input=server.url,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        result = json.loads(out.stdout.strip().splitlines()[-1])
+        result["mode"] = mode
+        result["requests"] = subgraph.requests
+        result["mb_received"] = subgraph.bytes_sent / 1e6
+        result["rows_per_sec"] = result["rows"] / result["seconds"]
+        results.append(result)
+        print(result)
+
+    server.shutdown()
+
+    cols = [
+        "mode",
+        "rows",
+        "seconds",
+        "rows_per_sec",
+        "requests",
+        "mb_received",
+        "peak_rss_mb",
+    ]
+    return pd.DataFrame(results)[cols].round(2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--content", default="options")
+    parser.add_argument("--options", type=int, default=100000)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--skip-cost", type=float, default=0.0)
+    parser.add_argument("--modes", nargs="+", choices=list(modes))
+    # internal: run a single mode, the url comes in over stdin
+    parser.add_argument("--run", choices=list(modes), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run is not None:
+        print(json.dumps(run_mode(args.run, args.content, sys.stdin.read().strip())))
+    else:
+        df = run_benchmark(
+            args.content, args.options, args.latency, args.skip_cost, args.modes
+        )
+        print(df.to_string(index=False))
@@ -0,0 +1,127 @@
+"""
+benchmark of the payoff kernels (see `payoff.py`) against the chained `np.where` version
+they replaced in `prepare_data.get_projected_profit`, on random options e.g.
+
+    python benchmark_payoff.py --options 100000 --shocks 101
+
+the numba kernels are only timed if numba is installed
+"""
+
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+
+import payoff
+
+
+def make_options(n: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame(
+        {
+            "type": pd.Categorical(rng.choice(["CALL", "PUT"], n)),
+            "current_price": rng.choice([18000.0, 600.0], n),
+            "amount": rng.uniform(0.1, 50, n),
+            "premium": rng.uniform(0.01, 2, n),
+        }
+    )
+    df["strike"] = df["current_price"] * rng.uniform(0.7, 1.3, n)
+    fee = rng.uniform(0.01, 0.1, n) * df["current_price"]
+    df["breakeven"] = np.where(
+        df["type"] == "CALL", df["strike"] + fee, df["strike"] - fee
+    )
+    return df
+
+
+def _payoff_where(df: pd.DataFrame) -> pd.DataFrame:
+    """the chained `np.where` version as baseline"""
+
+    df["projected_profit"] = np.where(
+        (df["type"] == "CALL") & (df["current_price"] < df["strike"]),
+        -df["premium"],
+        np.nan,
+    )
+    df["projected_profit"] = np.where(
+        (df["type"] == "PUT") & (df["current_price"] > df["strike"]),
+        -df["premium"],
+        df["projected_profit"],
+    )
+    df["projected_profit"] = np.where(
+        (df["type"] == "CALL") & (df["current_price"] >= df["strike"]),
+        ((df["current_price"] - df["breakeven"]) * df["amount"]) / df["current_price"],
+        df["projected_profit"],
+    )
+    df["projected_profit"] = np.where(
+        (df["type"] == "PUT") & (df["current_price"] <= df["strike"]),
+        ((df["breakeven"] - df["current_price"]) * df["amount"]) / df["current_price"],
+        df["projected_profit"],
+    )
+    df["profit"] = np.where(
+        df["projected_profit"] < -df["premium"], -df["premium"], df["projected_profit"]
+    )
+    df["group"] = np.where(df["profit"] == -df["premium"], "OTM", "ITM")
+    return df
+
+
+def _args(df: pd.DataFrame) -> list:
+    cols = ["current_price", "strike", "breakeven", "amount", "premium"]
+    return [df[col].values for col in cols] + [(df["type"] == "CALL").values]
+
+
+def _timeit(f, repeat: int) -> float:
+    f()  # warm up (and jit compile)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        f()
+    return (time.perf_counter() - start) / repeat
+
+
+def run_benchmark(n_options: int = 100000, n_shocks: int = 101, repeat: int = 5):
+
+    df = make_options(n_options)
+    args = _args(df)
+    shocks = np.linspace(-0.5, 0.5, n_shocks)
+    price, others = args[0], args[1:]
+
+    kernels = {
+        ("payoff", "where"): lambda: _payoff_where(df.copy()),
+        ("payoff", "numpy"): lambda: payoff._payoff_numpy(*args),
+        ("scenarios", "numpy"): lambda: payoff._scenarios_numpy(price, shocks, *others),
+    }
+    if payoff.numba is not None:
+        kernels[("payoff", "numba")] = lambda: payoff._payoff(*args)
+        kernels[("scenarios", "numba")] = lambda: payoff._scenarios(
+            price, shocks, *others
+        )
+
+    # all of them have to agree before timing them
+    reference = _payoff_where(df.copy())
+    for (kernel, name), f in kernels.items():
+        if kernel == "payoff" and name != "where":
+            profit, itm = f()
+            assert np.allclose(profit, reference["profit"])
+            assert (np.where(itm, "ITM", "OTM") == reference["group"]).all()
+    if payoff.numba is not None:
+        assert np.allclose(
+            kernels[("scenarios", "numba")](), kernels[("scenarios", "numpy")]()
+        )
+
+    results = []
+    for (kernel, name), f in kernels.items():
+        seconds = _timeit(f, repeat)
+        results.append({"kernel": kernel, "backend": name, "ms": seconds * 1000})
+        print(results[-1])
+
+    return pd.DataFrame(results).round(2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--options", type=int, default=100000)
+    parser.add_argument("--shocks", type=int, default=101)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    df = run_benchmark(args.options, args.shocks, args.repeat)
+    print(df.to_string(index=False))
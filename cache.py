@@ -0,0 +1,151 @@
+"""
+ttl cache for query responses: in-memory lru tier + optional on-disk tier,
+serves stale entries while they get refreshed in the background. concurrent misses
+of the same key share one fetch (single-flight)
+"""
+
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable
+
+
+def make_key(query: str, variables: dict = None) -> str:
+    """normalized query text (whitespace collapsed) + variables (sorted keys)"""
+    query = re.sub(r"\s+", " ", query).strip()
+    variables = json.dumps(variables or {}, sort_keys=True)
+    return hashlib.sha1(f"{query}|{variables}".encode()).hexdigest()
+
+
+class TTLCache:
+    """
+    `get(key, fetch, ttl, stale_ttl)` returns the cached value if it is younger than `ttl`.
+    if it is older but younger than `ttl + stale_ttl` the stale value is returned and
+    `fetch` runs in the background, otherwise `fetch` is called right away
+    """
+
+    def __init__(self, maxsize: int = 512, path: str = None):
+        self.maxsize = maxsize
+        self.path = path
+        self._data = OrderedDict()  # key -> (stored_at, value)
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        self._inflight = {}  # key -> Future of the fetch of a miss
+        self.generation = None  # see `use_generation`
+        self._executor = ThreadPoolExecutor(max_workers=2)
+        self.hits, self.misses, self.stale = 0, 0, 0
+
+    def get(
+        self, key: str, fetch: Callable[[], Any], ttl: float, stale_ttl: float = None
+    ) -> Any:
+        stale_ttl = ttl if stale_ttl is None else stale_ttl
+        entry = self._lookup(key)
+
+        if entry is not None:
+            age = time.time() - entry[0]
+            if age < ttl:
+                self.hits += 1
+                return entry[1]
+            if age < ttl + stale_ttl:
+                self.stale += 1
+                self._revalidate(key, fetch)
+                return entry[1]
+
+        self.misses += 1
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                # someone else is fetching it already, wait for that one
+                leader = False
+            else:
+                future = self._inflight[key] = Future()
+                leader = True
+
+        if not leader:
+            return future.result()
+
+        try:
+            value = fetch()
+            self._store(key, value)
+            future.set_result(value)
+            return value
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+
+    def set(self, key: str, value: Any):
+        """stores `value` as fresh e.g. after refreshing it ahead of the readers"""
+        self._store(key, value)
+
+    def use_generation(self, generation: int) -> bool:
+        """
+        clears the cache when `generation` (e.g. a data version) is newer than the one
+        of the entries. False for an older one, its values must not be stored
+        """
+        with self._lock:
+            if self.generation is not None and generation < self.generation:
+                return False
+            if generation != self.generation:
+                self._data.clear()
+                self.generation = generation
+            return True
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def _lookup(self, key: str):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                return self._data[key]
+
+        if self.path is not None:
+            try:
+                with open(os.path.join(self.path, f"{key}.json")) as f:
+                    entry = tuple(json.load(f))
+            except (OSError, ValueError):
+                return None
+            self._store(key, entry[1], entry[0], to_disk=False)
+            return entry
+
+        return None
+
+    def _store(self, key: str, value: Any, stored_at: float = None, to_disk=True):
+        stored_at = time.time() if stored_at is None else stored_at
+        with self._lock:
+            self._data[key] = (stored_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+        if self.path is not None and to_disk:
+            os.makedirs(self.path, exist_ok=True)
+            with open(os.path.join(self.path, f"{key}.json"), "w") as f:
+                json.dump([stored_at, value], f)
+
+    def _revalidate(self, key: str, fetch: Callable[[], Any]):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                self._store(key, fetch())
+            except Exception as e:
+                # keep serving the stale value, next call will try again
+                print(e)
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        self._executor.submit(refresh)
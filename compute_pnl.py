@@ -1,4 +1,3 @@
-import requests
 import typing
 import time
 import math
@@ -8,76 +7,14 @@ import pandas as pd
 import numpy as np
 import scipy
 import mibian
-from pycoingecko import CoinGeckoAPI
 
 import abi_stuff
+import api
+import prices
 
 
-query = """{
-options(where: {status: "ACTIVE"}, first: 100, skip: page_size) {
-symbol
-status
-strike
-amount
-expiration
-type
-account
-}
-}"""
-
-
-def _run_query(query):
-    request = requests.post(
-        "https://api.thegraph.com/subgraphs/name/ppunky/hegic-v888",
-        json={"query": query},
-    )
-    if request.status_code == 200:
-        return request.json()
-    else:
-        raise Exception(
-            "Query failed to run by returning code of {}. {}".format(
-                request.status_code, query
-            )
-        )
-
-
-def loop_over_pages() -> typing.List:
-    """
-    function for looping over paginated content
-    """
-
-    data = []
-    page_size = 0
-    page = 1
-
-    while True:
-        print("page:", page)
-        q = query
-
-        q = q.replace("skip: page_size", f"skip: {page_size}")
-        try:
-            response = _run_query(q)
-            try:
-                response = response["data"]
-            except KeyError as e:
-                print(e)
-                break
-            try:
-                sample = response["options"]
-                if len(sample) > 0:
-                    data.append(pd.DataFrame(sample))
-                else:
-                    break
-            except KeyError as e:
-                print(e)
-                break
-            # increase skip param
-            page_size += 100
-            page += 1
-        except:
-            break
-
-    return data
+# only the fields needed for the greeks (`id` and `timestamp` come with every pull)
+fields = ["symbol", "status", "strike", "amount", "expiration", "type", "account"]
 
 
 def get_new_data():
@@ -88,11 +25,11 @@ def get_new_data():
     global df, underlying_prices, writetoken_totbal
 
     print("pulling active options...")
-    data = loop_over_pages()
-    df = pd.concat(data).reset_index(drop=True)
-    df["days_to_expiry"] = (df["expiration"] - time.time()) / (60 * 60 * 24)
-    cols = ["strike", "amount"]
-    df[cols] = df[cols].astype(float)
+    # same paginator as the app: failed pages are retried with backoff and raised
+    # after `api.max_retries` instead of returning partial data
+    df = api.get_data("options_active", workers=1, fields=fields)
+    now = pd.Timestamp.utcnow().tz_localize(None)
+    df["days_to_expiry"] = (df["expiration"] - now) / pd.Timedelta(days=1)
     df = df[(df["days_to_expiry"] > 0) & (df["strike"] > 0)]
 
     # compute greeks
@@ -109,6 +46,8 @@ def get_new_data_every(period=300):
     """
 
     while True:
+        # the greeks need the current spot prices, not the stale cached ones
+        prices.refresh_spot_prices()
         get_new_data()
         print("data updated")
         time.sleep(period)
@@ -152,12 +91,9 @@ def calculate_greeks(
 ) -> typing.Tuple[pd.DataFrame, typing.Dict[str, float], typing.Dict[str, float]]:
     """we apply the greeks on each row over the dataframe"""
 
-    # pricing API
-    cg = CoinGeckoAPI()
-
-    # lambdas for getting IV and current price of underlying
+    # lambdas for getting IV and current price of underlying (cached spot prices)
     f_vol = lambda x: math.sqrt(x.functions.impliedVolRate().call())
-    f_pri = lambda x: cg.get_price(ids=x, vs_currencies="usd")[x]["usd"]
+    f_pri = lambda x: prices.get_spot_price(x)
 
     price_wbtc, price_eth = f_pri("bitcoin"), f_pri("ethereum")
 
@@ -0,0 +1,262 @@
+"""
+pre-aggregated P&L of the active options over
+symbol x period_days x amount bucket x expiration bucket x strike bucket (x type x group),
+the charts sum the selected cells instead of filtering and summing all rows
+"""
+
+from typing import Callable, List
+
+import numpy as np
+import pandas as pd
+
+
+from filter_index import FilterIndex
+
+# strike buckets per symbol (quantile edges, outliers would squash equal widths)
+strike_buckets = 20
+
+
+def parse_box(relayoutData: dict) -> tuple:
+    """box selection of the bubble chart as (expiration from/to, strike from/to) or None"""
+    try:
+        return (
+            pd.Timestamp(relayoutData["xaxis.range[0]"]),
+            pd.Timestamp(relayoutData["xaxis.range[1]"]),
+            relayoutData["yaxis.range[0]"],
+            relayoutData["yaxis.range[1]"],
+        )
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+class PnLCube:
+    """
+    the decile cut points of every (symbol, period combination) come from the
+    `FilterIndex`, all of them become amount bucket edges (a cut point and the range up to the next
+    one are two buckets), so any decile selection is an exact range of amount buckets.
+
+    selections without a box are slices of a roll-up over expiration/strike. box
+    selections sum the cells which are completely inside the box and only go
+    through the rows of the cells on its edges. `pnl`/`pnl_pct_changes` return None
+    if a selection can't be answered from the cube (e.g. decile not on the slider)
+    """
+
+    def __init__(
+        self,
+        df: pd.DataFrame,
+        shocks: np.ndarray,
+        scenario_profits: Callable[[pd.DataFrame, np.ndarray], np.ndarray],
+        index: FilterIndex = None,
+    ):
+        self.df = df
+        self.shocks = shocks
+        self.scenario_profits = scenario_profits
+        self.index = FilterIndex(df) if index is None else index
+
+        self.amount_cuts = {}  # symbol -> sorted cut points of all period combinations
+        amount_bucket = np.zeros(len(df), dtype="int64")
+        strike_bucket = np.zeros(len(df), dtype="int64")
+
+        for symbol, X in df.groupby("symbol", observed=True):
+            rows = df.index.get_indexer(X.index)
+            cuts = [q for key, q in self.index.cuts.items() if key[0] == symbol]
+            cuts = np.unique(np.concatenate(cuts))
+            self.amount_cuts[symbol] = cuts = cuts[~np.isnan(cuts)]
+            amount_bucket[rows] = self._amount_bucket(cuts, X["amount"].values)
+
+            edges = np.unique(
+                np.nanquantile(X["strike"], np.linspace(0, 1, strike_buckets + 1))
+            )
+            strike_bucket[rows] = np.searchsorted(edges, X["strike"].values)
+
+        keys = ["symbol", "period_days", "amount_bucket", "expiration_bucket"]
+        keys += ["strike_bucket", "type", "group"]
+        X = pd.DataFrame(
+            {
+                "symbol": np.asarray(df["symbol"], dtype=object),
+                "period_days": df["period_days"].values,
+                "amount_bucket": amount_bucket,
+                "expiration_bucket": df["expiration"].dt.floor("D").values,
+                "strike_bucket": strike_bucket,
+                "type": np.asarray(df["type"], dtype=object),
+                "group": np.asarray(df["group"], dtype=object),
+                "profit": df["profit"].values,
+                "expiration": df["expiration"].values,
+                "strike": df["strike"].values,
+            }
+        )
+        codes = X.groupby(keys, dropna=False).ngroup().values
+
+        # the exact expiration/strike ranges of a cell decide if it's inside a box
+        agg = {key: (key, "first") for key in keys}
+        agg.update(
+            profit=("profit", "sum"),
+            expiration_min=("expiration", "min"),
+            expiration_max=("expiration", "max"),
+            strike_min=("strike", "min"),
+            strike_max=("strike", "max"),
+        )
+        self.cells = X.groupby(codes).agg(**agg).reset_index(drop=True)
+
+        # row positions of every cell
+        order = np.argsort(codes, kind="stable")
+        starts = np.searchsorted(codes[order], np.arange(len(self.cells)))
+        self.rows = np.split(order, starts[1:])
+
+        # roll-up over expiration/strike for the selections without a box, sorted by
+        # symbol, period and amount bucket so that a decile range is a slice per period
+        keys = ["symbol", "period_days", "amount_bucket"]
+        codes = X.groupby(keys, dropna=False).ngroup().values
+        self.rollup = X.groupby(codes)[keys].first().reset_index(drop=True)
+        self.segments = {
+            key: (rows[0], rows[-1] + 1)
+            for key, rows in self.rollup.groupby(keys[:2]).indices.items()
+        }
+
+        tg, self.type_groups = pd.MultiIndex.from_arrays(
+            [X["type"], X["group"]]
+        ).factorize()
+        shape = (len(self.rollup), len(self.type_groups))
+        self.rollup_profit = np.zeros(shape)
+        self.rollup_count = np.zeros(shape, dtype="int64")
+        np.add.at(self.rollup_profit, (codes, tg), np.nan_to_num(X["profit"].values))
+        np.add.at(self.rollup_count, (codes, tg), 1)
+
+        order = np.argsort(codes, kind="stable")
+        starts = np.searchsorted(codes[order], np.arange(len(self.rollup)))
+        profits = np.nan_to_num(scenario_profits(df, shocks))
+        self.rollup_scenarios = np.add.reduceat(profits[order], starts, axis=0)
+
+    @staticmethod
+    def _amount_bucket(cuts: np.ndarray, amount: np.ndarray) -> np.ndarray:
+        """2i + 1 for amount == cuts[i], 2i for the range below cuts[i]"""
+        i = np.searchsorted(cuts, amount)
+        exact = cuts[np.minimum(i, len(cuts) - 1)] == amount
+        return 2 * i + exact
+
+    def _buckets(self, symbol: str, period: List[str], amounts: List[int]) -> tuple:
+        """selected periods and amount bucket range, None if nothing is selected"""
+
+        periods = self.index.periods_of(period)
+        lb, ub = self.index.amount_range(symbol, period, amounts)
+        if np.isnan(lb) or np.isnan(ub):
+            return None
+        i, j = np.searchsorted(self.amount_cuts[symbol], [lb, ub])
+
+        return periods, 2 * i + 1, 2 * j + 1
+
+    def _slices(self, symbol: str, periods: np.ndarray, lo: int, hi: int) -> list:
+        """rows of the roll-up in the amount bucket range [lo, hi]"""
+
+        slices = []
+        for period in periods:
+            if (symbol, period) not in self.segments:
+                continue
+            start, end = self.segments[(symbol, period)]
+            buckets = self.rollup["amount_bucket"].values[start:end]
+            slices.append(
+                slice(
+                    start + np.searchsorted(buckets, lo, side="left"),
+                    start + np.searchsorted(buckets, hi, side="right"),
+                )
+            )
+        return slices
+
+    def _cells(
+        self, symbol: str, periods: np.ndarray, lo: int, hi: int, box: tuple
+    ) -> tuple:
+        """
+        mask of the cells completely inside the box selection and the selected rows
+        of the cells on its edges
+        """
+
+        cells = self.cells
+        e0, e1, s0, s1 = box
+
+        mask = (
+            (cells["symbol"] == symbol)
+            & cells["period_days"].isin(periods)
+            & cells["amount_bucket"].between(lo, hi)
+        ).values
+        inside = (
+            (cells["expiration_min"] >= e0)
+            & (cells["expiration_max"] <= e1)
+            & (cells["strike_min"] >= s0)
+            & (cells["strike_max"] <= s1)
+        ).values
+        outside = (
+            (cells["expiration_max"] < e0)
+            | (cells["expiration_min"] > e1)
+            | (cells["strike_max"] < s0)
+            | (cells["strike_min"] > s1)
+        ).values
+
+        X = self._rows(np.flatnonzero(mask & ~inside & ~outside))
+        X = X[X["expiration"].between(e0, e1) & X["strike"].between(s0, s1)]
+
+        return mask & inside, X
+
+    def _rows(self, cells: np.ndarray) -> pd.DataFrame:
+        if len(cells) == 0:
+            return self.df.iloc[[]]
+        return self.df.iloc[np.concatenate([self.rows[k] for k in cells])]
+
+    def pnl(
+        self, symbol: str, period: List[str], amounts: List[int], relayoutData: dict
+    ) -> pd.DataFrame:
+        """profit per type and group (ITM/OTM) of the selection"""
+
+        if any(a not in range(11) for a in amounts):
+            return None
+
+        cols = ["type", "group", "profit"]
+        buckets = self._buckets(symbol, period, amounts)
+        if buckets is None:
+            return pd.DataFrame({"type": [], "group": [], "profit": np.zeros(0)})
+
+        box = parse_box(relayoutData)
+        if box is not None:
+            mask, X = self._cells(symbol, *buckets, box)
+            X = pd.concat(
+                [self.cells.loc[mask, cols], X[cols].astype({"type": object})]
+            )
+            return X.groupby(["type", "group"])["profit"].sum().reset_index()
+
+        slices = self._slices(symbol, *buckets)
+        zeros = np.zeros(len(self.type_groups))
+        profit = sum((self.rollup_profit[s].sum(axis=0) for s in slices), zeros)
+        count = sum((self.rollup_count[s].sum(axis=0) for s in slices), zeros)
+        observed = np.flatnonzero(count)
+
+        return pd.DataFrame(
+            {
+                "type": [self.type_groups[k][0] for k in observed],
+                "group": [self.type_groups[k][1] for k in observed],
+                "profit": profit[observed],
+            }
+        )
+
+    def pnl_pct_changes(
+        self, symbol: str, period: List[str], amounts: List[int], relayoutData: dict
+    ) -> np.ndarray:
+        """summed scenario profits (for `shocks`) of the selection"""
+
+        if any(a not in range(11) for a in amounts):
+            return None
+
+        buckets = self._buckets(symbol, period, amounts)
+        if buckets is None:
+            return np.zeros(len(self.shocks))
+
+        box = parse_box(relayoutData)
+        if box is not None:
+            # no scenarios per cell (too many of them), only skips the filtering
+            mask, X = self._cells(symbol, *buckets, box)
+            X = pd.concat([self._rows(np.flatnonzero(mask)), X])
+            return np.nansum(self.scenario_profits(X, self.shocks), axis=0)
+
+        slices = self._slices(symbol, *buckets)
+        return sum(
+            (self.rollup_scenarios[s].sum(axis=0) for s in slices),
+            np.zeros(len(self.shocks)),
+        )
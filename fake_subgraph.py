@@ -0,0 +1,414 @@
+"""
+local stand-in for the hegic subgraph which serves synthetic `options`, `poolBalances`
+and `bondingCurveEvents`. it understands the subset of graphql our queries use
+(aliases, variables, first/skip/where/orderBy/orderDirection, `_meta`), so both the
+skip and the cursor pagination can be run against it offline e.g.
+
+    python fake_subgraph.py --options 100000 --latency 0.05
+
+and then point `transport.subgraph_url` to the printed url
+"""
+
+import re
+import json
+import time
+import bisect
+import random
+import argparse
+import operator
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# fields which are compared/sorted as strings, everything else as numbers
+string_fields = [
+    "id",
+    "account",
+    "symbol",
+    "status",
+    "type",
+    "exercise_tx",
+]
+
+_token = re.compile(
+    r"""\s*(?:
+    ([{}()\[\]:!=$])
+    |("(?:[^"\\]|\\.)*")
+    |(-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?)
+    |([_A-Za-z][_0-9A-Za-z]*)
+    )""",
+    re.VERBOSE,
+)
+
+
+def make_data(
+    n_options: int = 10000,
+    n_pool_balances: int = 2000,
+    n_bonding_curve_events: int = 2000,
+    seed: int = 0,
+) -> dict:
+    """
+    synthetic entities with the same fields and json types as the real subgraph
+    (BigInt and BigDecimal fields are strings)
+    """
+
+    rnd = random.Random(seed)
+    now = int(time.time())
+    start = now - 120 * 86400
+    periods = [86400, 604800, 1209600, 1814400, 2419200]
+
+    def account():
+        return "0x%040x" % rnd.randrange(16**10)
+
+    options = []
+    for i in range(n_options):
+        symbol = rnd.choice(["ETH", "WBTC"])
+        timestamp = start + int(i * 120 * 86400 / max(n_options, 1))
+        period = rnd.choice(periods)
+        expiration = timestamp + period
+        price = 400 if symbol == "ETH" else 15000
+        strike = price * rnd.uniform(0.7, 1.3)
+        amount = rnd.lognormvariate(0, 1.5)
+        premium = amount * rnd.uniform(0.01, 0.1)
+        settlement_fee = amount * 0.01
+        exercised = expiration < now and rnd.random() < 0.3
+        status = (
+            "ACTIVE" if expiration >= now else "EXERCISED" if exercised else "EXPIRED"
+        )
+        block = 11000000 + i * 3
+        options.append(
+            {
+                "id": f"{symbol}-{i}",
+                "account": account(),
+                "symbol": symbol,
+                "status": status,
+                "strike": f"{strike:.8f}",
+                "amount": f"{amount:.8f}",
+                "lockedAmount": f"{amount:.8f}",
+                "timestamp": str(timestamp),
+                "period": str(period),
+                "expiration": str(expiration),
+                "type": rnd.choice(["CALL", "PUT"]),
+                "premium": f"{premium:.8f}",
+                "settlementFee": f"{settlement_fee:.8f}",
+                "totalFee": f"{premium + settlement_fee:.8f}",
+                "exercise_timestamp": str(expiration - 3600) if exercised else None,
+                "exercise_tx": "0x%064x" % i if exercised else None,
+                "profit": f"{premium if exercised else 0:.8f}",
+                "impliedVolatility": str(rnd.randint(50, 120)),
+                "block": str(block),
+                "_change_block": block,
+            }
+        )
+
+    pool_balances = []
+    for i in range(n_pool_balances):
+        block = 11000000 + i * 7
+        amount = rnd.uniform(1, 100)
+        pool_balances.append(
+            {
+                "id": f"{block}-{i}",
+                "timestamp": str(
+                    start + int(i * 120 * 86400 / max(n_pool_balances, 1))
+                ),
+                "account": account(),
+                "symbol": rnd.choice(["ETH", "WBTC"]),
+                "type": rnd.choice(["PROVIDE", "WITHDRAW"]),
+                "amount": f"{amount:.8f}",
+                "tokens": f"{amount * 1000:.8f}",
+                "availableBalance": f"{rnd.uniform(1000, 5000):.8f}",
+                "totalBalance": f"{rnd.uniform(5000, 10000):.8f}",
+                "currentRatio": f"{rnd.uniform(0.9, 1.1):.8f}",
+                "_change_block": block,
+            }
+        )
+
+    bonding_curve_events = []
+    for i in range(n_bonding_curve_events):
+        block = 11000000 + i * 11
+        eth_amount = rnd.uniform(0.1, 10)
+        bonding_curve_events.append(
+            {
+                "id": f"{block}-{i}",
+                "timestamp": str(
+                    start + int(i * 120 * 86400 / max(n_bonding_curve_events, 1))
+                ),
+                "account": account(),
+                "type": rnd.choice(["BUY", "SELL"]),
+                "tokenAmount": f"{eth_amount * 5000:.8f}",
+                "ethAmount": f"{eth_amount:.8f}",
+                "bondingCurveSoldAmount": f"{i * 1000:.8f}",
+                "_change_block": block,
+            }
+        )
+
+    return {
+        "options": options,
+        "poolBalances": pool_balances,
+        "bondingCurveEvents": bonding_curve_events,
+    }
+
+
+_comparisons = {
+    "gt": operator.gt,
+    "gte": operator.ge,
+    "lt": operator.lt,
+    "lte": operator.le,
+}
+
+
+def _sort_key(field: str, value):
+    if value is None:
+        return None
+    return value if field in string_fields else float(value)
+
+
+def _matches(row: dict, where: dict) -> bool:
+    for key, value in where.items():
+        if key == "_change_block":
+            if row["_change_block"] < value["number_gte"]:
+                return False
+            continue
+
+        field, op = key, "eq"
+        for suffix in ["_not_in", "_in", "_gte", "_lte", "_gt", "_lt", "_not"]:
+            if key.endswith(suffix) and key[: -len(suffix)] in row:
+                field, op = key[: -len(suffix)], suffix[1:]
+                break
+
+        x = _sort_key(field, row[field])
+        if op in ["in", "not_in"]:
+            found = x in [_sort_key(field, v) for v in value]
+            if found != (op == "in"):
+                return False
+            continue
+
+        y = _sort_key(field, value)
+        if op == "eq" and x != y or op == "not" and x == y:
+            return False
+        if op in _comparisons and (x is None or not _comparisons[op](x, y)):
+            return False
+
+    return True
+
+
+class _Parser:
+    """recursive descent parser for the graphql subset we send"""
+
+    def __init__(self, text: str, variables: dict):
+        self.tokens = [
+            next(t for t in m.groups() if t is not None)
+            for m in _token.finditer(text.replace(",", " "))
+            if any(m.groups())
+        ]
+        self.pos = 0
+        self.variables = variables
+
+    def peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def take(self, expected=None):
+        token = self.peek()
+        if expected is not None and token != expected:
+            raise ValueError(f"expected {expected!r}, got {token!r}")
+        self.pos += 1
+        return token
+
+    def document(self) -> list:
+        if self.peek() in ["query", "mutation"]:
+            self.take()
+            if self.peek() not in ["(", "{"]:
+                self.take()  # operation name
+            if self.peek() == "(":
+                # variable definitions, the values come with the request
+                depth = 0
+                while True:
+                    token = self.take()
+                    depth += token == "("
+                    depth -= token == ")"
+                    if depth == 0:
+                        break
+        return self.selection_set()
+
+    def selection_set(self) -> list:
+        self.take("{")
+        fields = []
+        while self.peek() != "}":
+            fields.append(self.field())
+        self.take("}")
+        return fields
+
+    def field(self) -> dict:
+        name = self.take()
+        alias = name
+        if self.peek() == ":":
+            self.take()
+            name = self.take()
+        arguments = {}
+        if self.peek() == "(":
+            self.take()
+            while self.peek() != ")":
+                key = self.take()
+                self.take(":")
+                arguments[key] = self.value()
+            self.take(")")
+        selection = self.selection_set() if self.peek() == "{" else []
+        return {
+            "alias": alias,
+            "name": name,
+            "arguments": arguments,
+            "fields": selection,
+        }
+
+    def value(self):
+        token = self.take()
+        if token == "$":
+            return self.variables.get(self.take())
+        if token == "{":
+            obj = {}
+            while self.peek() != "}":
+                key = self.take()
+                self.take(":")
+                obj[key] = self.value()
+            self.take("}")
+            return obj
+        if token == "[":
+            items = []
+            while self.peek() != "]":
+                items.append(self.value())
+            self.take("]")
+            return items
+        if token.startswith('"'):
+            return json.loads(token)
+        if re.match(r"-?\d", token):
+            return float(token) if re.search(r"[.eE]", token) else int(token)
+        return {"true": True, "false": False, "null": None}.get(token, token)
+
+
+class Subgraph:
+    """
+    answers graphql requests from `data`. every request sleeps `latency` seconds plus
+    `skip_cost` seconds per skipped row (skip is a scan on the real indexer as well)
+    """
+
+    def __init__(self, data: dict, latency: float = 0.0, skip_cost: float = 0.0):
+        self.data = data
+        self.latency = latency
+        self.skip_cost = skip_cost
+        self.block = max(
+            [r["_change_block"] for rows in data.values() for r in rows] or [0]
+        )
+        self.requests = 0
+        self.bytes_sent = 0
+        self._lock = threading.Lock()
+        self._orders = {}  # (entity, field) -> rows sorted by that field
+
+    def reset_stats(self):
+        with self._lock:
+            self.requests, self.bytes_sent = 0, 0
+
+    def execute(self, query: str, variables: dict = None) -> dict:
+        fields = _Parser(query, variables or {}).document()
+        data, skipped = {}, 0
+        for field in fields:
+            if field["name"] == "_meta":
+                data[field["alias"]] = {"block": {"number": self.block}}
+                continue
+            data[field["alias"]], n = self._resolve(field)
+            skipped += n
+
+        time.sleep(self.latency + skipped * self.skip_cost)
+        return {"data": data}
+
+    def _ordered(self, entity: str, order_by: str) -> list:
+        key = (entity, order_by)
+        if key not in self._orders:
+            rows = [r for r in self.data[entity] if r[order_by] is not None]
+            rows.sort(key=lambda r: _sort_key(order_by, r[order_by]))
+            nulls = [r for r in self.data[entity] if r[order_by] is None]
+            self._orders[key] = (
+                rows + nulls,
+                [_sort_key(order_by, r[order_by]) for r in rows],
+            )
+        return self._orders[key]
+
+    def _resolve(self, field: dict):
+        args = field["arguments"]
+        first = args.get("first", 100)
+        skip = args.get("skip", 0)
+        where = args.get("where") or {}
+        order_by = args.get("orderBy", "id")
+        descending = args.get("orderDirection", "asc") == "desc"
+
+        rows, keys = self._ordered(field["name"], order_by)
+
+        # start right behind the cursor instead of scanning from the beginning
+        start = 0
+        for op, side in [("gt", "right"), ("gte", "left")]:
+            bound = where.get(f"{order_by}_{op}")
+            if bound is not None and not descending:
+                bound = _sort_key(order_by, bound)
+                f = bisect.bisect_right if side == "right" else bisect.bisect_left
+                start = max(start, f(keys, bound))
+
+        candidates = reversed(rows) if descending else rows[start:]
+        result, n_skipped = [], 0
+        for row in candidates:
+            if not _matches(row, where):
+                continue
+            if n_skipped < skip:
+                n_skipped += 1
+                continue
+            result.append({f["name"]: row[f["name"]] for f in field["fields"]})
+            if len(result) >= first:
+                break
+
+        return result, n_skipped
+
+
+def serve(subgraph: Subgraph, port: int = 0) -> ThreadingHTTPServer:
+    """starts the server in a background thread, the url is `server.url`"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            try:
+                response = subgraph.execute(body["query"], body.get("variables"))
+            except Exception as e:
+                response = {"errors": [{"message": str(e)}]}
+            payload = json.dumps(response).encode()
+
+            with subgraph._lock:
+                subgraph.requests += 1
+                subgraph.bytes_sent += len(payload)
+
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    server.daemon_threads = True
+    server.url = f"http://127.0.0.1:{server.server_address[1]}"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--options", type=int, default=10000)
+    parser.add_argument("--pool-balances", type=int, default=2000)
+    parser.add_argument("--bonding-curve-events", type=int, default=2000)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--skip-cost", type=float, default=0.0)
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+
+    data = make_data(args.options, args.pool_balances, args.bonding_curve_events)
+    server = serve(Subgraph(data, args.latency, args.skip_cost), args.port)
+    print(f"fake subgraph listening on {server.url}")
+    threading.Event().wait()
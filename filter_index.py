@@ -0,0 +1,94 @@
+"""
+index over the active options for the symbol/period/decile selection of the charts,
+a slider state resolves to row positions with two searchsorted and a few bitmap ORs
+instead of masks and quantiles over the whole frame
+"""
+
+import itertools
+from typing import List
+
+import numpy as np
+import pandas as pd
+
+
+# the positions of the decile slider (same floats as `i / 10` in prepare_data)
+deciles = [i / 10 for i in range(11)]
+
+
+class FilterIndex:
+    """
+    per symbol: row positions sorted by amount, a bitmap (aligned with them) per period
+    and the amount at every decile for every combination of periods. row positions
+    are into the frame the index was built from (or a copy of it)
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        self.periods = sorted(df["period_days"].dropna().unique())
+
+        self.rows = {}  # symbol -> row positions sorted by amount
+        self.amounts = {}  # symbol -> amounts in that order
+        self.bitmaps = {}  # (symbol, period) -> bool array aligned with `rows`
+        self.cuts = {}  # (symbol, periods) -> amount at each decile
+        self.latest = {}  # symbol -> row position of the newest option
+
+        for symbol, X in df.groupby("symbol", observed=True):
+            order = np.argsort(X["amount"].values, kind="stable")
+            self.rows[symbol] = df.index.get_indexer(X.index)[order]
+            self.amounts[symbol] = amount = X["amount"].values[order]
+            period_days = X["period_days"].values[order]
+            self.latest[symbol] = df.index.get_loc(X["timestamp_unix"].idxmax())
+
+            for period in self.periods:
+                self.bitmaps[(symbol, period)] = period_days == period
+
+            for r in range(1, len(self.periods) + 1):
+                for periods in itertools.combinations(self.periods, r):
+                    q = pd.Series(amount[self._bitmap(symbol, periods)])
+                    self.cuts[(symbol, periods)] = q.quantile(deciles).values
+
+    def _bitmap(
+        self, symbol: str, periods: tuple, lo: int = 0, hi: int = None
+    ) -> np.ndarray:
+        """rows (of the amount sorted rows[lo:hi]) in one of the `periods`"""
+        hi = len(self.rows[symbol]) if hi is None else hi
+        bitmap = np.zeros(hi - lo, dtype=bool)
+        for period in periods:
+            bitmap |= self.bitmaps[(symbol, period)][lo:hi]
+        return bitmap
+
+    def periods_of(self, period: List[str]) -> tuple:
+        """the indexed periods which are selected (same matching as `isin`)"""
+        return tuple(
+            np.array(self.periods)[pd.Series(self.periods).isin(period).values]
+        )
+
+    def amount_range(
+        self, symbol: str, period: List[str], amounts: List[float]
+    ) -> tuple:
+        """amounts at the deciles `amounts` (0-10) of the options of `symbol` and `period`"""
+
+        periods = self.periods_of(period)
+        if (symbol, periods) not in self.cuts:
+            return np.nan, np.nan
+
+        if all(a in range(11) for a in amounts):
+            q = self.cuts[(symbol, periods)]
+            return q[int(amounts[0])], q[int(amounts[1])]
+
+        # off the slider marks
+        q = pd.Series(self.amounts[symbol][self._bitmap(symbol, periods)])
+        return q.quantile(amounts[0] / 10), q.quantile(amounts[1] / 10)
+
+    def select(self, symbol: str, period: List[str], amounts: List[float]):
+        """row positions (in frame order) of the selection"""
+
+        lb, ub = self.amount_range(symbol, period, amounts)
+        if np.isnan(lb) or np.isnan(ub):
+            return np.array([], dtype="int64")
+
+        amount = self.amounts[symbol]
+        lo = np.searchsorted(amount, lb, side="left")
+        hi = np.searchsorted(amount, ub, side="right")
+        bitmap = self._bitmap(symbol, self.periods_of(period), lo, hi)
+
+        return np.sort(self.rows[symbol][lo:hi][bitmap])
@@ -0,0 +1,114 @@
+"""
+payoff of the options in a single pass: projected profit (floored at -premium) and
+ITM/OTM, plus the unfloored profits for shocks on the price (see `scenarios`).
+jit compiled if numba is installed (`pip install numba`), numpy otherwise
+"""
+
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+backend = "numba" if numba is not None else "numpy"
+
+
+def _payoff_numpy(price, strike, breakeven, amount, premium, call):
+    itm = np.where(call, price >= strike, price <= strike)
+    profit = np.where(call, price - breakeven, breakeven - price)
+    profit *= amount
+    profit /= price
+    profit = np.where(itm, profit, -premium)
+    # a profit can never be smaller than -premium
+    np.maximum(profit, -premium, out=profit)
+    return profit, profit != -premium
+
+
+def _scenarios_numpy(current_price, shocks, strike, breakeven, amount, premium, call):
+    price = current_price[:, None] * (1 + shocks[None, :])
+    strike, breakeven = strike[:, None], breakeven[:, None]
+    call = call[:, None]
+    itm = np.where(call, price >= strike, price <= strike)
+    profit = np.where(call, price - breakeven, breakeven - price)
+    profit *= amount[:, None]
+    profit /= price
+    return np.where(itm, profit, -premium[:, None])
+
+
+def _payoff_loop(price, strike, breakeven, amount, premium, call):
+    profit = np.empty(len(price))
+    itm = np.empty(len(price), dtype=np.bool_)
+    for i in range(len(price)):
+        p = price[i]
+        if call[i] and p >= strike[i]:
+            x = (p - breakeven[i]) * amount[i] / p
+        elif not call[i] and p <= strike[i]:
+            x = (breakeven[i] - p) * amount[i] / p
+        else:
+            x = -premium[i]
+        if x < -premium[i]:
+            x = -premium[i]
+        profit[i] = x
+        itm[i] = x != -premium[i]
+    return profit, itm
+
+
+def _scenarios_loop(current_price, shocks, strike, breakeven, amount, premium, call):
+    profit = np.empty((len(current_price), len(shocks)))
+    for i in range(len(current_price)):
+        for j in range(len(shocks)):
+            p = current_price[i] * (1 + shocks[j])
+            if call[i] and p >= strike[i]:
+                profit[i, j] = (p - breakeven[i]) * amount[i] / p
+            elif not call[i] and p <= strike[i]:
+                profit[i, j] = (breakeven[i] - p) * amount[i] / p
+            else:
+                profit[i, j] = -premium[i]
+    return profit
+
+
+if numba is not None:
+    _payoff = numba.njit(cache=True, nogil=True)(_payoff_loop)
+    _scenarios = numba.njit(cache=True, nogil=True)(_scenarios_loop)
+else:
+    _payoff, _scenarios = _payoff_numpy, _scenarios_numpy
+
+
+def _arrays(*arrays):
+    return [np.ascontiguousarray(x, dtype="float64") for x in arrays]
+
+
+def payoff(
+    price: np.ndarray,
+    strike: np.ndarray,
+    breakeven: np.ndarray,
+    amount: np.ndarray,
+    premium: np.ndarray,
+    call: np.ndarray,
+):
+    """
+    profit of each option at `price` and if it's ITM. OTM is -premium, ITM is the
+    distance to the break-even scaled by amount / price, floored at -premium
+    (an ITM option which doesn't cover its fees counts as OTM)
+    """
+    arrays = _arrays(price, strike, breakeven, amount, premium)
+    return _payoff(*arrays, np.ascontiguousarray(call, dtype=np.bool_))
+
+
+def scenarios(
+    current_price: np.ndarray,
+    shocks: np.ndarray,
+    strike: np.ndarray,
+    breakeven: np.ndarray,
+    amount: np.ndarray,
+    premium: np.ndarray,
+    call: np.ndarray,
+) -> np.ndarray:
+    """
+    (options x shocks) profits for the price moving by each of the `shocks` (pct-changes),
+    same as `payoff` but without the -premium floor
+    """
+    arrays = _arrays(current_price, shocks, strike, breakeven, amount, premium)
+    return _scenarios(*arrays, np.ascontiguousarray(call, dtype=np.bool_))
@@ -197,7 +197,7 @@ def plot_pool_balance(balances: pd.DataFrame, symbol: str):
 def plot_put_call_ratio(df: pd.DataFrame, symbol: str):
 
     X = df[df["symbol"] == symbol]
-    X = X.groupby("type")["amount"].sum().to_frame("Volume")
+    X = X.groupby("type", observed=True)["amount"].sum().to_frame("Volume")
     X["pct"] = X["Volume"] / X["Volume"].sum()
     X = X.reset_index().rename(columns={"type": "Option Type"})
 
@@ -2,51 +2,151 @@ import typing
 
 import pandas as pd
 import numpy as np
-from pycoingecko import CoinGeckoAPI
 
-from api import _run_query, queries
+import cache
+import cube
+import filter_index
+import payoff
+import prices
+from api import run_batch, queries
 
 
-# launch cg api
-cg = CoinGeckoAPI()
+# P&L pct-change chart per (data version, filter, shock grid), entries of older
+# data versions simply fall out of the lru
+pct_change_cache = cache.TTLCache(maxsize=64)
+
+# filtered options per (data version, symbol, period, amounts, box, ID), shared by the
+# chart callbacks which all fire on the same slider change (see `filter_options`)
+view_cache = cache.TTLCache(maxsize=32)
+
+
+# fields of an option which don't change after its creation (see `get_static_fields`)
+# by option id, only options which weren't seen before get computed on a refresh
+static_fields = pd.DataFrame()
+
+# seconds around the creation timestamps in which to look for historical prices
+price_padding = 86400
 
 
 def get_projected_profit(df: pd.DataFrame) -> pd.DataFrame:
     """
-    calculate project profit for status==ACTIVE
+    calculate project profit for status==ACTIVE, the price independent fields
+    are computed once per option (see `static_fields`)
     """
 
-    # for those I need to find a price (use coingecko)
-    cg = CoinGeckoAPI()
+    global static_fields
 
-    time_col = "timestamp_unix"
+    new = df[~df["id"].isin(static_fields.index)]
+    if len(new) > 0:
+        print(f"computing static fields for {len(new)} new options")
+        new = get_static_fields(new)
+        static_fields = pd.concat([static_fields, new]) if len(static_fields) else new
+    # no longer active options are not needed anymore
+    static_fields = static_fields[static_fields.index.isin(df["id"])]
+
+    df = (
+        df.merge(static_fields, left_on="id", right_index=True, how="left")
+        .sort_values("timestamp_unix", kind="mergesort")
+        .reset_index(drop=True)
+    )
+
+    # get latest prices
     currency = "usd"
+    current_price_wbtc = prices.get_spot_price("bitcoin", currency)
+    current_price_eth = prices.get_spot_price("ethereum", currency)
+    df["current_price"] = np.where(
+        df["symbol"] == "WBTC", current_price_wbtc, current_price_eth
+    )
+
+    # The projected profit is only relevant for options with status ACTIVE cause
+    # the calculation of it is based on the current price which means that the projected
+    # profit for exercised and expired options won't match the actual profit! (but thats ok,
+    # as we only need it for ACTIVE anyways)
+    # OTM: the profit is simply -premium, ITM: the distance to the break even price
+    # (scaled by amount / current price), computed in one pass (see `payoff.py`)
+
+    # NOTE(!)have to think about this, but I think overall its better the way it is not using this!
+    # in some isolated cases (usually with large options) small differences in the calculated
+    # break even price and the actual break even might be large enough to lead to some illogical
+    # values for the projected profit.
+    # I apply a filter on top, to make sure we don't see anything weird.
+    # A profit can never be smaller than -premium (no matter what scenario)
+
+    # OTM is if the profit is simply the same as the negative premium
+    # e.g. premium was 10eth -> if the profit equals -10 then the option is OTM
+    # else ITM
+    profit, itm = payoff.payoff(
+        df["current_price"].values,
+        df["strike"].values,
+        df["breakeven"].values,
+        df["amount"].values,
+        df["premium"].values,
+        (df["type"] == "CALL").values,
+    )
+    df["profit"] = profit
+    df["group"] = np.where(itm, "ITM", "OTM")
+
+    # the P&L for pct-changes of the current price is computed on demand
+    # for the selected options only (see `prepare_pnl_pct_changes`)
+
+    return df
+
+
+def compact(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    smaller copy of the (active) options for the app: categoricals for the repeating
+    strings (the accounts included), the option number instead of the id string and
+    float32 instead of float64 (plenty for sizes, prices and fees)
+    """
+
+    X = df.drop(columns=["id"])
+    X.insert(0, "option_nb", df["id"].str.rsplit("-", n=1).str[-1].astype("int32"))
+
+    for col in ["account", "group"]:
+        if col in X.columns:
+            X[col] = X[col].astype("category")
+
+    floats = X.select_dtypes("float64").columns
+    X[floats] = X[floats].astype("float32")
 
-    prices_btc = cg.get_coin_market_chart_range_by_id(
-        id="bitcoin",
-        vs_currency=currency,
-        from_timestamp=df[df["symbol"] == "WBTC"][time_col].min(),
-        to_timestamp=df[df["symbol"] == "WBTC"][time_col].max(),
-    )["prices"]
+    for col in ["period", "period_days"]:
+        if col in X.columns:
+            X[col] = pd.to_numeric(X[col], downcast="integer")
 
-    prices_eth = cg.get_coin_market_chart_range_by_id(
-        id="ethereum",
-        vs_currency=currency,
-        from_timestamp=df[df["symbol"] == "ETH"][time_col].min(),
-        to_timestamp=df[df["symbol"] == "ETH"][time_col].max(),
-    )["prices"]
+    return X
 
-    time_col_cg = "timestamp_unix_gc"
-    prices_btc = pd.DataFrame(prices_btc, columns=[time_col_cg, "price"])
-    prices_btc["symbol"] = "WBTC"
 
-    prices_eth = pd.DataFrame(prices_eth, columns=[time_col_cg, "price"])
-    prices_eth["symbol"] = "ETH"
+def get_static_fields(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    historical price at creation, totalFeeUSD, premium_usd and breakeven by option id
+    """
 
-    df_prices = pd.concat([prices_btc, prices_eth]).reset_index(drop=True)
+    # for those I need to find a price (historical coingecko prices from the local
+    # store, which only downloads what it doesn't have yet)
+    time_col = "timestamp_unix"
+    currency = "usd"
+    coins = {"WBTC": "bitcoin", "ETH": "ethereum"}
+
+    df_prices = []
+    for symbol, coin in coins.items():
+        timestamps = df.loc[df["symbol"] == symbol, time_col]
+        if len(timestamps) == 0:
+            continue
+        # padded, so that the options at the edges (e.g. a single new one)
+        # still find their nearest price
+        x = prices.get_prices(
+            coin,
+            from_timestamp=timestamps.min() - price_padding,
+            to_timestamp=timestamps.max() + price_padding,
+            currency=currency,
+        )
+        x["symbol"] = symbol
+        df_prices.append(x)
 
-    # from millisecond timestamp to seconds
-    df_prices[time_col_cg] //= 1000
+    time_col_cg = prices.time_col
+    df_prices = pd.concat(df_prices).reset_index(drop=True)
+    # `symbol` is categorical in the options data, merge keys need the same dtype
+    df_prices["symbol"] = df_prices["symbol"].astype(df["symbol"].dtype)
 
     # merge nearest historical prices to option creation timestamp
     df = pd.merge_asof(
@@ -76,135 +176,132 @@ def get_projected_profit(df: pd.DataFrame) -> pd.DataFrame:
     # negative based on the above calculation so I set the min value to 0
     df["breakeven"] = np.where(df["breakeven"] < 0, 0, df["breakeven"])
 
-    # get latest prices
-    current_price_wbtc = cg.get_price(ids="bitcoin", vs_currencies=currency)["bitcoin"][
-        currency
-    ]
-    current_price_eth = cg.get_price(ids="ethereum", vs_currencies=currency)[
-        "ethereum"
-    ][currency]
-    df["current_price"] = np.where(
-        df["symbol"] == "WBTC", current_price_wbtc, current_price_eth
-    )
+    cols = [prices.time_col, "price", "totalFeeUSD", "premium_usd", "breakeven"]
+    return df.set_index("id")[cols]
 
-    # The projected profit is only relevant for options with status ACTIVE cause
-    # the calculation of it is based on the current price which means that the projected
-    # profit for exercised and expired options won't match the actual profit! (but thats ok,
-    # as we only need it for ACTIVE anyways)
-    # I) OTM: projected_profit is simply -premium
-    df["projected_profit"] = np.where(
-        (df["type"] == "CALL") & (df["current_price"] < df["strike"]),
-        -df["premium"],
-        np.nan,
-    )
 
-    df["projected_profit"] = np.where(
-        (df["type"] == "PUT") & (df["current_price"] > df["strike"]),
-        -df["premium"],
-        df["projected_profit"],
-    )
+def shock_grid(
+    lower: float = -0.50, upper: float = 0.50, step: float = 0.01
+) -> np.ndarray:
+    """pct-changes of the spot price from `lower` to `upper` (both included)"""
+    # + 0.0 turns a rounded -0.0 into 0.0
+    return np.round(np.arange(lower, upper + step / 2, step), 4) + 0.0
 
-    # II) ITM
-    df["projected_profit"] = np.where(
-        (df["type"] == "CALL") & (df["current_price"] >= df["strike"]),
-        ((df["current_price"] - df["breakeven"]) * df["amount"]) / df["current_price"],
-        df["projected_profit"],
-    )
 
-    df["projected_profit"] = np.where(
-        (df["type"] == "PUT") & (df["current_price"] <= df["strike"]),
-        ((df["breakeven"] - df["current_price"]) * df["amount"]) / df["current_price"],
-        df["projected_profit"],
-    )
+def get_filter_index(df: pd.DataFrame) -> filter_index.FilterIndex:
+    """symbol/period/decile index of the active options (see `filter_index.py`)"""
+    return filter_index.FilterIndex(df)
 
-    df["profit"] = df["projected_profit"]
 
-    df = df.drop(columns=["projected_profit"])
+def get_pnl_cube(
+    df: pd.DataFrame, index: filter_index.FilterIndex = None
+) -> cube.PnLCube:
+    """P&L of the active options pre-aggregated for the charts (see `cube.py`)"""
+    return cube.PnLCube(df, shock_grid(), get_scenario_profits, index)
 
-    # NOTE(!)have to think about this, but I think overall its better the way it is not using this!
-    # in some isolated cases (usually with large options) small differences in the calculated
-    # break even price and the actual break even might be large enough to lead to some illogical
-    # values for the projected profit.
-    # I apply a filter on top, to make sure we don't see anything weird.
-    # A profit can never be smaller than -premium (no matter what scenario)
-    df["profit"] = np.where(df["profit"] < -df["premium"], -df["premium"], df["profit"])
 
-    # OTM is if the profit is simply the same as the negative premium
-    # e.g. premium was 10eth -> if the profit equals -10 then the option is OTM
-    # else ITM
-    df["group"] = np.where(df["profit"] == -df["premium"], "OTM", "ITM")
-
-    ################################### this section is for calculating offsets on the current price
-    # to get an overview of how the pools P&L ranges with changes pct-changes (+/- 0-25 pct) in the spot price
-    # the below values will be bonkers for no longer active options, so set them to Nan later on
-    # we only need this for active stuff
-    spread = 0.50
-    for i in np.arange(0, spread + 0.01, 0.01):
-        i = round(i, 2)
-
-        # if price increases (this will be good for the calls and bad for the puts)
-        df[f"current_price_plus_{i}pct"] = df["current_price"] + df["current_price"] * i
-        # if price decreases (will be bad for calls and good for puts)
-        df[f"current_price_minus_{i}pct"] = (
-            df["current_price"] - df["current_price"] * i
-        )
+def select_options(
+    X: pd.DataFrame,
+    symbol: str,
+    period: typing.List[str],
+    amounts: typing.List[float],
+    index: filter_index.FilterIndex = None,
+) -> pd.DataFrame:
+    """
+    options of `symbol` with a period in `period` and an amount between the deciles
+    `amounts` (0-10). looked up in the `index` if given (which has to be built from `X`)
+    """
 
-        # OTM
-        df[f"projected_profit_plus_{i}pct"] = np.where(
-            (df["type"] == "CALL") & (df[f"current_price_plus_{i}pct"] < df["strike"]),
-            -df["premium"],
-            np.nan,
-        )
+    if index is not None:
+        return X.iloc[index.select(symbol, period, amounts)]
 
-        df[f"projected_profit_plus_{i}pct"] = np.where(
-            (df["type"] == "PUT") & (df[f"current_price_plus_{i}pct"] > df["strike"]),
-            -df["premium"],
-            df[f"projected_profit_plus_{i}pct"],
-        )
+    # scale the decile amounts to proper deciles e.g. from 5 -> 0.5
+    # so that it can be used with the quantile func
+    amounts = [i / 10 for i in amounts]
 
-        df[f"projected_profit_minus_{i}pct"] = np.where(
-            (df["type"] == "CALL") & (df[f"current_price_minus_{i}pct"] < df["strike"]),
-            -df["premium"],
-            np.nan,
-        )
+    X = X[X["symbol"] == symbol]
+    X = X[X["period_days"].isin(period)]
+    lb, ub = X["amount"].quantile(amounts[0]), X["amount"].quantile(amounts[1])
+    X = X[X["amount"].between(lb, ub)]
 
-        df[f"projected_profit_minus_{i}pct"] = np.where(
-            (df["type"] == "PUT") & (df[f"current_price_minus_{i}pct"] > df["strike"]),
-            -df["premium"],
-            df[f"projected_profit_minus_{i}pct"],
-        )
+    return X
 
-        # II) ITM
-        df[f"projected_profit_plus_{i}pct"] = np.where(
-            (df["type"] == "CALL") & (df[f"current_price_plus_{i}pct"] >= df["strike"]),
-            ((df[f"current_price_plus_{i}pct"] - df["breakeven"]) * df["amount"])
-            / df[f"current_price_plus_{i}pct"],
-            df[f"projected_profit_plus_{i}pct"],
-        )
 
-        df[f"projected_profit_plus_{i}pct"] = np.where(
-            (df["type"] == "PUT") & (df[f"current_price_plus_{i}pct"] <= df["strike"]),
-            ((df["breakeven"] - df[f"current_price_plus_{i}pct"]) * df["amount"])
-            / df[f"current_price_plus_{i}pct"],
-            df[f"projected_profit_plus_{i}pct"],
-        )
+def filter_options(
+    X: pd.DataFrame,
+    symbol: str,
+    period: typing.List[str],
+    amounts: typing.List[float],
+    relayoutData: dict = None,
+    id_: str = None,
+    index: filter_index.FilterIndex = None,
+    data_version: int = None,
+) -> pd.DataFrame:
+    """
+    `select_options` narrowed down to the ID/account `id_` and the box selection of the
+    bubble chart. memoized per `data_version` if given (the cache is cleared when a
+    newer one comes in), the views are shared by the callbacks, don't modify them
+    """
 
-        df[f"projected_profit_minus_{i}pct"] = np.where(
-            (df["type"] == "CALL")
-            & (df[f"current_price_minus_{i}pct"] >= df["strike"]),
-            ((df[f"current_price_minus_{i}pct"] - df["breakeven"]) * df["amount"])
-            / df[f"current_price_minus_{i}pct"],
-            df[f"projected_profit_minus_{i}pct"],
-        )
+    box = cube.parse_box(relayoutData)
+    id_ = id_ if id_ is not None and len(id_) > 0 else None
+
+    def compute():
+        if box is not None:
+            # the box is applied on the (memoized) view without it
+            X_ = filter_options(
+                X, symbol, period, amounts, None, id_, index, data_version
+            )
+            X_ = X_[X_["expiration"].between(box[0], box[1])]
+            return X_[X_["strike"].between(box[2], box[3])]
+
+        if id_ is not None:
+            X_ = filter_options(
+                X, symbol, period, amounts, None, None, index, data_version
+            )
+            if len(id_) >= 40:
+                # filter to unique account address (can have [0, inf) rows)
+                return X_[X_["account"].str.lower() == id_.lower()]
+            # fitler to unique option ID (results in 1 row!)
+            return X_[X_["option_nb"].astype(str) == id_]
+
+        return select_options(X, symbol, period, amounts, index)
+
+    # a callback which still works on older data than the cache doesn't memoize
+    if data_version is None or not view_cache.use_generation(data_version):
+        return compute()
+
+    key = cache.make_key(
+        "filter_options",
+        {
+            "data_version": data_version,
+            "symbol": symbol,
+            "period": sorted(period),
+            "amounts": amounts,
+            "box": None if box is None else [str(x) for x in box],
+            "id": id_,
+        },
+    )
+    return view_cache.get(key, compute, ttl=float("inf"))
 
-        df[f"projected_profit_minus_{i}pct"] = np.where(
-            (df["type"] == "PUT") & (df[f"current_price_minus_{i}pct"] <= df["strike"]),
-            ((df["breakeven"] - df[f"current_price_minus_{i}pct"]) * df["amount"])
-            / df[f"current_price_minus_{i}pct"],
-            df[f"projected_profit_minus_{i}pct"],
-        )
 
-    return df
+def get_scenario_profits(df: pd.DataFrame, shocks: np.ndarray) -> np.ndarray:
+    """
+    projected profit of every option if the current price moved by each of the `shocks`
+    (in one pass over an options x shocks grid). same logic as for `profit`:
+    OTM is -premium, ITM is the distance to the break-even scaled by amount / price
+    (but without the -premium floor, to keep the chart as it was)
+    """
+
+    return payoff.scenarios(
+        df["current_price"].values,
+        shocks,
+        df["strike"].values,
+        df["breakeven"].values,
+        df["amount"].values,
+        df["premium"].values,
+        (df["type"] == "CALL").values,
+    )
 
 
 def prepare_bubble(
@@ -212,9 +309,13 @@ def prepare_bubble(
     symbol: str,
     period: typing.List[str],
     amounts: typing.List[float],
+    index: filter_index.FilterIndex = None,
+    id_: str = None,
+    data_version: int = None,
 ) -> typing.Tuple[pd.DataFrame, int, float, int]:
     """
-    main function to prepare data for bubble chart
+    main function to prepare data for bubble chart (options of the ID/account `id_`
+    only if given)
     """
 
     if symbol == "WBTC":
@@ -222,22 +323,21 @@ def prepare_bubble(
     elif symbol == "ETH":
         symbol_cg = "ethereum"
 
-    current_price = cg.get_price(ids=symbol_cg, vs_currencies="usd")[symbol_cg]["usd"]
-
-    # scale the decile amounts to proper deciles e.g. from 5 -> 0.5
-    # so that it can be used with the quantile func
-    amounts = [i / 10 for i in amounts]
+    current_price = prices.get_spot_price(symbol_cg)
 
-    X = X.sort_values("type")
-    X = X[X["symbol"] == symbol]
     # price will stay the same for the below sections! (but must be after the symbol selector)
-    current_iv = int(X.loc[X["timestamp_unix"].idxmax()]["impliedVolatility"])
-    X = X[X["period_days"].isin(period)]
-    lb, ub = X["amount"].quantile(amounts[0]), X["amount"].quantile(amounts[1])
-    X = X[X["amount"].between(lb, ub)]
+    if index is not None:
+        latest = X.iloc[index.latest[symbol]]
+    else:
+        Y = X[X["symbol"] == symbol]
+        latest = Y.loc[Y["timestamp_unix"].idxmax()]
+    current_iv = int(latest["impliedVolatility"])
+
+    X = filter_options(X, symbol, period, amounts, None, id_, index, data_version)
+    X = X.sort_values("type")
 
     # get ID
-    X["id_nb"] = X["id"].str.split("-").apply(lambda x: x[1])
+    X["id_nb"] = X["option_nb"].astype(str)
 
     # rename columms for plotting
     col_mapping = {
@@ -282,52 +382,37 @@ def prepare_pnl(
     amounts: typing.List[int],
     relayoutData: dict,
     id_: str,
+    pnl_cube: cube.PnLCube = None,
+    index: filter_index.FilterIndex = None,
+    data_version: int = None,
 ) -> pd.DataFrame:
     """
-    main function to prepare data for P%L chart
+    main function to prepare data for P%L chart, summed from the `pnl_cube`
+    if given (and no ID/account is searched)
     """
 
-    # scale the decile amounts to proper deciles e.g. from 5 -> 0.5
-    # so that it can be used with the quantile func
-    amounts = [i / 10 for i in amounts]
-
-    X = X[X["symbol"] == symbol]
-    X = X[X["period_days"].isin(period)]
-    lb, ub = X["amount"].quantile(amounts[0]), X["amount"].quantile(amounts[1])
-    X = X[X["amount"].between(lb, ub)]
+    if pnl_cube is not None and (id_ is None or len(id_) == 0):
+        agg = pnl_cube.pnl(symbol, period, amounts, relayoutData)
+        if agg is not None:
+            return _pnl_totals(agg)
 
-    if id_ is not None and len(id_) > 0:
-        # first check if this ID is even in the select symbol set
-        if len(id_) >= 40:
-            # filter to unique account address (can have [0, inf) rows)
-            X = X[X["account"].str.lower() == id_.lower()]
-        else:
-            # fitler to unique option ID (results in 1 row!)
-            X["id"] = X["id"].str.split("-").apply(lambda x: x[1])
-            X = X[X["id"] == id_]
-
-    # this block is for the interactive charting capability
-    try:
-        expiration_right = relayoutData["xaxis.range[0]"]
-        expiration_left = relayoutData["xaxis.range[1]"]
-        strike_top = relayoutData["yaxis.range[0]"]
-        strike_btm = relayoutData["yaxis.range[1]"]
-        X = X[X["expiration"].between(expiration_right, expiration_left)]
-        X = X[X["strike"].between(strike_top, strike_btm)]
-    except:
-        pass
+    X = filter_options(
+        X, symbol, period, amounts, relayoutData, id_, index, data_version
+    )
 
     # now apply the specific stuff to obtain the P&L
-    agg = (
-        X.groupby(["type", "group"])["profit"]
-        .sum()
-        .reset_index()
-        .sort_values(["type", "group"])
-        .reset_index(drop=True)
-    )
+    agg = X.groupby(["type", "group"], observed=True)["profit"].sum().reset_index()
+
+    return _pnl_totals(agg)
+
+
+def _pnl_totals(agg: pd.DataFrame) -> pd.DataFrame:
+    """adds the P&L (for the pool) per type to the profit per type and group"""
+
+    agg = agg.sort_values(["type", "group"]).reset_index(drop=True)
 
     # get total for plots
-    z = agg.groupby("type")[["profit"]].sum().reset_index()
+    z = agg.groupby("type", observed=True)[["profit"]].sum().reset_index()
     z["group"] = ["P&L"] * len(z)
     z = z[agg.columns.tolist()]
     agg = pd.concat([agg, z])
@@ -338,12 +423,13 @@ def prepare_pnl(
 
 
 def get_pool_balances() -> pd.DataFrame:
-    pool_balance_wbtc = _run_query(queries["poolBalances_latest_WBTC"])
-    pool_balance_eth = _run_query(queries["poolBalances_latest_ETH"])
+    # both symbols in one round trip
+    keys = ["poolBalances_latest_WBTC", "poolBalances_latest_ETH"]
+    response = run_batch({key: queries[key] for key in keys}, cached=True)
 
-    f = lambda x: pd.DataFrame(x["data"]["poolBalances"]).set_index("symbol")
-    balances_eth = f(pool_balance_eth)
-    balances_wbtc = f(pool_balance_wbtc)
+    f = lambda x: pd.DataFrame(x).set_index("symbol")
+    balances_eth = f(response["poolBalances_latest_ETH"])
+    balances_wbtc = f(response["poolBalances_latest_WBTC"])
     balances = pd.concat([balances_eth, balances_wbtc]).astype("float64")
     balances["util_ratio"] = 1 - (
         balances["availableBalance"] / balances["totalBalance"]
@@ -359,9 +445,15 @@ def prepare_pnl_pct_changes(
     symbol: str,
     period: str,
     amounts: typing.List[int],
+    shocks: np.ndarray = None,
+    data_version: int = None,
+    pnl_cube: cube.PnLCube = None,
+    index: filter_index.FilterIndex = None,
 ) -> pd.DataFrame:
     """
-    code for aggregating data to plot P&L for different pct changes in spot price
+    code for aggregating data to plot P&L for different pct changes in spot price.
+    `shocks` defaults to `shock_grid()`, the result is memoized per `data_version`
+    (pass None to skip the memo). summed from the `pnl_cube` for its shocks
     """
 
     if symbol == "WBTC":
@@ -369,56 +461,99 @@ def prepare_pnl_pct_changes(
     elif symbol == "ETH":
         symbol_cg = "ethereum"
 
-    current_price = cg.get_price(ids=symbol_cg, vs_currencies="usd")[symbol_cg]["usd"]
+    current_price = prices.get_spot_price(symbol_cg)
+
+    shocks = shock_grid() if shocks is None else shocks
+
+    def compute():
+        return _pnl_pct_changes(
+            df,
+            balances,
+            relayoutData,
+            symbol,
+            period,
+            amounts,
+            shocks,
+            pnl_cube,
+            index,
+            data_version,
+        )
 
-    X = df.copy()
+    if data_version is None:
+        return compute(), current_price
+
+    key = cache.make_key(
+        "pnl_pct_changes",
+        {
+            "data_version": data_version,
+            "symbol": symbol,
+            "period": sorted(period),
+            "amounts": amounts,
+            "relayoutData": relayoutData,
+            "shocks": shocks.tolist(),
+        },
+    )
+    # the key changes with the data, so the entries never have to expire
+    x = pct_change_cache.get(key, compute, ttl=float("inf"))
 
-    # scale the decile amounts to proper deciles e.g. from 5 -> 0.5
-    # so that it can be used with the quantile func
-    amounts = [i / 10 for i in amounts]
+    return x, current_price
 
-    X = X[X["symbol"] == symbol]
-    X = X[X["period_days"].isin(period)]
-    lb, ub = X["amount"].quantile(amounts[0]), X["amount"].quantile(amounts[1])
-    X = X[X["amount"].between(lb, ub)]
 
-    # this block is for the interactive charting capability
-    try:
-        expiration_right = relayoutData["xaxis.range[0]"]
-        expiration_left = relayoutData["xaxis.range[1]"]
-        strike_top = relayoutData["yaxis.range[0]"]
-        strike_btm = relayoutData["yaxis.range[1]"]
-        X = X[X["expiration"].between(expiration_right, expiration_left)]
-        X = X[X["strike"].between(strike_top, strike_btm)]
-    except:
-        pass
-
-    # get the p&l's
-    cols = X.columns[X.columns.str.contains("projected_profit")]
-    x = X[cols].sum(axis=0)
+def _pnl_pct_changes(
+    df: pd.DataFrame,
+    balances: pd.DataFrame,
+    relayoutData: dict,
+    symbol: str,
+    period: str,
+    amounts: typing.List[int],
+    shocks: np.ndarray,
+    pnl_cube: cube.PnLCube = None,
+    index: filter_index.FilterIndex = None,
+    data_version: int = None,
+) -> pd.DataFrame:
+
+    x = None
+    if pnl_cube is not None and np.array_equal(shocks, pnl_cube.shocks):
+        x = pnl_cube.pnl_pct_changes(symbol, period, amounts, relayoutData)
+
+    if x is None:
+        x = _select_scenario_profits(
+            df, relayoutData, symbol, period, amounts, shocks, index, data_version
+        )
 
     # need to revert the sign to get the pnl for pool !
     x = -x
 
     # next need the current balance
     x = (x / balances.loc[symbol]["totalBalance"]) * 100
-    x = x.to_frame("pnl").reset_index()
-    x["pct"] = (
-        x["index"].str.split("_").apply(lambda x: x[-1]).str.strip("pct").astype(float)
+
+    # the scenarios are relative to the price at the last refresh
+    price = df.loc[df["symbol"] == symbol, "current_price"].max()
+
+    x = pd.DataFrame(
+        {"pct": shocks, "pnl": x, "projected_price": (price * (1 + shocks)).round(2)}
     )
-    x["sign"] = x["index"].str.split("_").apply(lambda x: x[-2])
 
-    x = x.assign(pct=np.where(x["sign"] == "plus", x["pct"], -x["pct"]))
+    return x
+
+
+def _select_scenario_profits(
+    df: pd.DataFrame,
+    relayoutData: dict,
+    symbol: str,
+    period: str,
+    amounts: typing.List[int],
+    shocks: np.ndarray,
+    index: filter_index.FilterIndex = None,
+    data_version: int = None,
+) -> np.ndarray:
 
-    z = (
-        X[X.columns[X.columns.str.contains("current_price_")]]
-        .apply(lambda x: x.unique())
-        .T.round(2)
+    X = filter_options(
+        df, symbol, period, amounts, relayoutData, None, index, data_version
     )
-    z = z.rename(columns={0: "projected_price"}).reset_index(drop=True)
-    x = pd.concat([x, z], axis=1)
 
-    return x, current_price
+    # get the p&l's (only for the selected options)
+    return np.nansum(get_scenario_profits(X, shocks), axis=0)
 
 
 def prepare_leaderboard(
@@ -428,15 +563,14 @@ def prepare_leaderboard(
     X = df.copy()
     X = X[X["symbol"] == symbol]
     X = X.sort_values(["amount", "profit"], ascending=False).reset_index(drop=True)
-    X["id"] = X["id"].str.split("-").apply(lambda x: x[1]).astype(int)
-    X = X[["amount", "profit", "id", "account"]]
+    X = X[["amount", "profit", "option_nb", "account"]]
 
     X = X.round(2)
     X = X.rename(
         columns={
             "amount": "Option Size",
             "profit": f"Profit in {symbol}",
-            "id": "Option ID",
+            "option_nb": "Option ID",
             "account": "Account",
         }
     )
@@ -0,0 +1,123 @@
+"""
+local store of historical coingecko prices (one parquet per coin), only the parts of a
+requested range which are not in the store yet get downloaded. spot prices come from
+a short lived cache (see `get_spot_price`)
+"""
+
+import os
+import json
+import time
+
+import numpy as np
+import pandas as pd
+
+import api
+import cache
+import transport
+
+
+cg = transport.coingecko()
+
+prices_dir = os.path.join(api.store_dir, "prices")
+
+# stored points further apart than this are a hole (coingecko returns daily prices for
+# ranges > 90 days, hourly or finer below), each hole gets downloaded again once
+max_gap = 2 * 86400
+
+time_col = "timestamp_unix_gc"
+
+# spot prices are fresh for `spot_ttl` seconds, after that they are served stale (for up
+# to `spot_stale_ttl`) while a single background request refreshes them. the refresh
+# loops call `refresh_spot_prices` so that the callbacks never wait for coingecko
+spot_coins = ["bitcoin", "ethereum"]
+spot_ttl = 30
+spot_stale_ttl = 600
+spot_cache = cache.TTLCache(maxsize=16)
+
+
+def _fetch(coin: str, currency: str, from_timestamp: int, to_timestamp: int):
+    prices = cg.get_coin_market_chart_range_by_id(
+        id=coin,
+        vs_currency=currency,
+        from_timestamp=from_timestamp,
+        to_timestamp=to_timestamp,
+    )["prices"]
+
+    df = pd.DataFrame(prices, columns=[time_col, "price"])
+    # from millisecond timestamp to seconds
+    df[time_col] = df[time_col].astype("int64") // 1000
+
+    return df
+
+
+def get_prices(
+    coin: str, from_timestamp: int, to_timestamp: int, currency: str = "usd"
+) -> pd.DataFrame:
+    """
+    prices of `coin` between two unix timestamps (in seconds). served from the store,
+    which first gets extended by the missing head/tail of the range and its holes
+    """
+
+    # there are no prices from the future (and the store would think it has them)
+    from_timestamp, to_timestamp = int(from_timestamp), int(to_timestamp)
+    to_timestamp = min(to_timestamp, int(time.time()))
+    path = os.path.join(prices_dir, f"{coin}_{currency}.parquet")
+    path_meta = os.path.join(prices_dir, f"{coin}_{currency}.json")
+
+    df = pd.DataFrame({time_col: np.array([], dtype="int64"), "price": []})
+    meta = {"from": from_timestamp, "to": to_timestamp, "refetched": []}
+    missing = [(from_timestamp, to_timestamp)]
+
+    if os.path.exists(path) and os.path.exists(path_meta):
+        df = pd.read_parquet(path)
+        with open(path_meta) as f:
+            meta = json.load(f)
+
+        missing = []
+        if from_timestamp < meta["from"]:
+            missing.append((from_timestamp, meta["from"]))
+        if to_timestamp > meta["to"]:
+            missing.append((meta["to"], to_timestamp))
+
+        t = df.loc[df[time_col].between(from_timestamp, to_timestamp), time_col].values
+        holes = np.flatnonzero(np.diff(t) > max_gap)
+        for start, end in zip(t[holes].tolist(), t[holes + 1].tolist()):
+            if [start, end] not in meta["refetched"]:
+                missing.append((start, end))
+                meta["refetched"].append([start, end])
+
+    if len(missing) > 0:
+        df = (
+            pd.concat([df] + [_fetch(coin, currency, *x) for x in missing])
+            .drop_duplicates(time_col, keep="last")
+            .sort_values(time_col)
+            .reset_index(drop=True)
+        )
+        meta["from"] = min(meta["from"], from_timestamp)
+        meta["to"] = max(meta["to"], to_timestamp)
+
+        os.makedirs(prices_dir, exist_ok=True)
+        df.to_parquet(path)
+        with open(path_meta, "w") as f:
+            json.dump(meta, f)
+
+    print(f"prices '{coin}': {len(missing)} missing ranges downloaded")
+
+    return df[df[time_col].between(from_timestamp, to_timestamp)].reset_index(drop=True)
+
+
+def get_spot_price(coin: str, currency: str = "usd") -> float:
+    """current price of `coin`, all `spot_coins` are fetched with the same request"""
+
+    ids = ",".join(sorted(set(spot_coins + [coin])))
+    fetch = lambda: cg.get_price(ids=ids, vs_currencies=currency)
+    prices = spot_cache.get(f"{ids}|{currency}", fetch, spot_ttl, spot_stale_ttl)
+
+    return prices[coin][currency]
+
+
+def refresh_spot_prices(currency: str = "usd"):
+    """fetches the `spot_coins` right away (blocking) and puts them into the cache"""
+
+    ids = ",".join(sorted(set(spot_coins)))
+    spot_cache.set(f"{ids}|{currency}", cg.get_price(ids=ids, vs_currencies=currency))
@@ -0,0 +1,75 @@
+"""
+profiles the data refreshes end to end. record once with network access
+
+    python profile_calls.py record app
+
+and then replay the recorded subgraph/coingecko/json-rpc calls without network
+
+    python profile_calls.py replay app
+
+targets: `app` (app.get_new_data), `prepare_data` (prepare_data.get_projected_profit)
+and `compute_pnl` (compute_pnl.get_new_data)
+"""
+
+import os
+import io
+import sys
+import pstats
+import argparse
+import cProfile
+import contextlib
+
+import transport
+
+
+def _app():
+    # the import already runs a refresh, the profiled one is the second
+    import app
+
+    app.get_new_data()
+
+
+def _prepare_data():
+    import api
+    import prepare_data
+
+    df = api.get_data("options_active")
+    prepare_data.get_projected_profit(df)
+
+
+def _compute_pnl():
+    import compute_pnl
+
+    compute_pnl.get_new_data()
+
+
+targets = {
+    "app": _app,
+    "prepare_data": _prepare_data,
+    "compute_pnl": _compute_pnl,
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("mode", choices=["record", "replay"])
+    parser.add_argument("target", choices=list(targets))
+    parser.add_argument("--path", default=transport.recording_path)
+    parser.add_argument("--top", type=int, default=30)
+    args = parser.parse_args()
+
+    if args.mode == "record":
+        transport.start_recording(args.path)
+    else:
+        transport.start_replay(args.path)
+
+    profiler = cProfile.Profile()
+    with contextlib.redirect_stdout(io.StringIO()):
+        profiler.runcall(targets[args.target])
+
+    stats = pstats.Stats(profiler).sort_stats("cumulative")
+    stats.print_stats(args.top)
+
+    # app and compute_pnl start their refresh loops on import, don't wait for them
+    sys.stdout.flush()
+    os._exit(0)
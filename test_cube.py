@@ -0,0 +1,132 @@
+"""
+the pre-aggregated paths of the charts (`cube.PnLCube`, `filter_index.FilterIndex`) have
+to give the same results as filtering the rows (`prepare_data.select_options` masks) e.g.
+
+    python -m pytest -q test_cube.py
+"""
+
+import itertools
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import api
+import fake_subgraph
+import payoff
+import prepare_data
+
+
+current_prices = {"ETH": 400.0, "WBTC": 15000.0}
+
+symbols = ["ETH", "WBTC"]
+periods = [[1, 7, 14, 21, 28], [7], [1, 28], [14, 21]]
+amounts = [[1, 10], [0, 10], [3, 7], [5, 5], [0, 1], [2.5, 7.5]]
+
+
+def make_options(n: int = 4000) -> pd.DataFrame:
+    """synthetic options (see `fake_subgraph.make_data`) as the app keeps them"""
+
+    data = fake_subgraph.make_data(n, n_pool_balances=0, n_bonding_curve_events=0)
+    sample = [
+        {k: v for k, v in row.items() if not k.startswith("_")}
+        for row in data["options"]
+    ]
+    df = api._decode(sample, "options")
+
+    df["current_price"] = df["symbol"].map(current_prices).astype("float64")
+    fee = df["totalFee"] * df["current_price"] / df["amount"]
+    df["breakeven"] = np.where(
+        df["type"] == "CALL", df["strike"] + fee, df["strike"] - fee
+    ).clip(0)
+    profit, itm = payoff.payoff(
+        df["current_price"].values,
+        df["strike"].values,
+        df["breakeven"].values,
+        df["amount"].values,
+        df["premium"].values,
+        (df["type"] == "CALL").values,
+    )
+    df["profit"] = profit
+    df["group"] = np.where(itm, "ITM", "OTM")
+
+    return prepare_data.compact(df)
+
+
+@pytest.fixture(scope="module")
+def options():
+    df = make_options()
+    index = prepare_data.get_filter_index(df)
+    return df, index, prepare_data.get_pnl_cube(df, index)
+
+
+def boxes(df: pd.DataFrame) -> list:
+    expiration = df["expiration"].sort_values()
+    lo, hi = expiration.iloc[len(df) // 4], expiration.iloc[3 * len(df) // 4]
+    strike_lo, strike_hi = df["strike"].quantile([0.2, 0.6])
+    box = {
+        "xaxis.range[0]": str(lo),
+        "xaxis.range[1]": str(hi),
+        "yaxis.range[0]": float(strike_lo),
+        "yaxis.range[1]": float(strike_hi),
+    }
+    # reversed: the expiration range is empty
+    reverse = {**box, "xaxis.range[0]": str(hi), "xaxis.range[1]": str(lo)}
+    return [None, {"autosize": True}, box, reverse]
+
+
+def selections():
+    return itertools.product(symbols, periods, amounts)
+
+
+def test_filter_index_selects_the_masked_rows(options):
+    df, index, _ = options
+
+    for symbol, period, amounts_ in selections():
+        expected = prepare_data.select_options(df, symbol, period, amounts_)
+        selected = prepare_data.select_options(df, symbol, period, amounts_, index)
+        assert selected.index.equals(expected.index), (symbol, period, amounts_)
+
+
+def test_cube_pnl_sums_the_masked_rows(options):
+    df, _, pnl_cube = options
+
+    answered = 0
+    for (symbol, period, amounts_), box in itertools.product(selections(), boxes(df)):
+        expected = prepare_data.prepare_pnl(df, symbol, period, amounts_, box, None)
+        if pnl_cube.pnl(symbol, period, amounts_, box) is None:
+            continue
+        agg = prepare_data.prepare_pnl(
+            df, symbol, period, amounts_, box, None, pnl_cube
+        )
+        answered += 1
+
+        key = (symbol, period, amounts_, box)
+        assert len(agg) == len(expected), key
+        assert (agg["type"].astype(str).values == expected["type"].astype(str)).all()
+        assert (agg["group"].values == expected["group"].values).all(), key
+        np.testing.assert_allclose(
+            agg["profit"], expected["profit"], rtol=1e-4, atol=1e-4, err_msg=str(key)
+        )
+
+    # everything on the slider marks comes from the cube
+    assert answered == len(symbols) * len(periods) * (len(amounts) - 1) * 4
+
+
+def test_cube_pnl_pct_changes_sums_the_masked_rows(options):
+    df, _, pnl_cube = options
+    balances = pd.DataFrame({"totalBalance": [1000.0, 10.0]}, index=["ETH", "WBTC"])
+    shocks = prepare_data.shock_grid()
+
+    for (symbol, period, amounts_), box in itertools.product(selections(), boxes(df)):
+        args = (df, balances, box, symbol, period, amounts_, shocks)
+        expected = prepare_data._pnl_pct_changes(*args)
+        x = prepare_data._pnl_pct_changes(*args, pnl_cube)
+
+        np.testing.assert_allclose(
+            x["pnl"],
+            expected["pnl"],
+            rtol=1e-4,
+            atol=1e-4,
+            err_msg=str((symbol, period, amounts_, box)),
+        )
@@ -0,0 +1,207 @@
+"""
+one pooled keep-alive http session shared by every outbound call (subgraph, coingecko,
+json-rpc node) so that consecutive pages/prices reuse the same tcp/tls connection.
+all calls can be recorded to a jsonl file and replayed from it (see `start_recording`)
+"""
+
+import json
+import time
+import datetime
+import threading
+import urllib.parse
+from collections import defaultdict
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from urllib3.util.retry import Retry
+from pycoingecko import CoinGeckoAPI
+
+subgraph_url = "https://api.thegraph.com/subgraphs/name/ppunky/hegic-v888"
+
+# (connect, read) in seconds
+timeout = (5, 60)
+# number of hosts we keep a pool for (subgraph, coingecko, ...)
+pool_connections = 4
+# max. open connections per host, further requests wait for a free one
+pool_maxsize = 8
+
+
+# record/replay state, None, "record" or "replay"
+mode = None
+recording_path = "recordings.jsonl"
+_recorded = defaultdict(list)  # key -> responses in the order they were recorded
+_replayed = defaultdict(int)  # key -> nb of times it was served
+_record_lock = threading.Lock()
+
+
+class _Session(requests.Session):
+    """session which applies the default timeout to every request (and records/replays)"""
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", timeout)
+
+        if mode == "replay":
+            return _replay(method, url, kwargs)
+
+        start = time.perf_counter()
+        response = super().request(method, url, **kwargs)
+
+        if mode == "record":
+            _record(method, url, kwargs, response, time.perf_counter() - start)
+
+        return response
+
+
+def _request_body(kwargs: dict):
+    if kwargs.get("json") is not None:
+        return kwargs["json"]
+    data = kwargs.get("data")
+    if isinstance(data, bytes):
+        data = data.decode()
+    try:
+        return json.loads(data) if data else None
+    except ValueError:
+        return data
+
+
+def _key(method: str, url: str, kwargs: dict) -> str:
+    body = _request_body(kwargs)
+    if isinstance(body, dict) and "jsonrpc" in body:
+        # web3 counts the request ids up, they don't identify the call
+        body = {k: v for k, v in body.items() if k != "id"}
+
+    # pycoingecko puts the params into the url (older versions) or into `params`
+    parts = urllib.parse.urlsplit(url)
+    params = dict(urllib.parse.parse_qsl(parts.query))
+    params.update({k: str(v) for k, v in (kwargs.get("params") or {}).items()})
+    url = urllib.parse.urlunsplit(parts._replace(query=""))
+    if url.endswith("/market_chart/range"):
+        # the price ranges end at the time of the call, only coin and currency identify
+        # them (a later replay gets the recorded ranges in the recorded order)
+        params = {k: v for k, v in params.items() if k not in ["from", "to"]}
+
+    return json.dumps([method.upper(), url, params or None, body], sort_keys=True)
+
+
+def _record(method, url, kwargs, response, seconds):
+    request_body = _request_body(kwargs)
+    entry = {
+        "key": _key(method, url, kwargs),
+        "method": method.upper(),
+        "url": url,
+        "body": request_body,
+        "status": response.status_code,
+        "content_type": response.headers.get("Content-Type"),
+        "content": response.content.decode("utf-8", errors="replace"),
+        "seconds": seconds,
+        "bytes_sent": len(json.dumps(request_body)) if request_body else 0,
+        "bytes_received": len(response.content),
+        "timestamp": time.time(),
+    }
+    with _record_lock:
+        with open(recording_path, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+
+
+def _replay(method, url, kwargs) -> requests.Response:
+    """
+    serves the recorded response of the same call. identical calls get their responses
+    in the recorded order, once those are used up the last one is repeated
+    """
+
+    key = _key(method, url, kwargs)
+    with _record_lock:
+        entries = _recorded.get(key)
+        if not entries:
+            raise requests.ConnectionError(f"no recording for {method} {url}")
+        entry = entries[min(_replayed[key], len(entries) - 1)]
+        _replayed[key] += 1
+
+    content = entry["content"]
+    body = _request_body(kwargs)
+    if isinstance(body, dict) and "jsonrpc" in body:
+        # answer with the id of this request
+        content = json.dumps({**json.loads(content), "id": body.get("id")})
+
+    response = requests.Response()
+    response.status_code = entry["status"]
+    response._content = content.encode()
+    response.headers = CaseInsensitiveDict({"Content-Type": entry["content_type"]})
+    response.url = url
+    response.encoding = "utf-8"
+    response.reason = "replayed"
+    response.elapsed = datetime.timedelta(seconds=entry["seconds"])
+
+    return response
+
+
+def start_recording(path: str = None, append: bool = False):
+    """writes every outbound call (request, response, timing, bytes) to `path` (jsonl)"""
+    global mode, recording_path
+    recording_path = path or recording_path
+    if not append:
+        open(recording_path, "w").close()
+    mode = "record"
+
+
+def start_replay(path: str = None):
+    """answers every outbound call from a recording, nothing goes over the network"""
+    global mode, recording_path
+    recording_path = path or recording_path
+    _recorded.clear()
+    _replayed.clear()
+    with open(recording_path) as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                _recorded[entry["key"]].append(entry)
+    mode = "replay"
+
+
+def stop():
+    global mode
+    mode = None
+
+
+adapter = HTTPAdapter(
+    pool_connections=pool_connections,
+    pool_maxsize=pool_maxsize,
+    pool_block=True,
+    # same retry policy pycoingecko uses for its own session. only idempotent methods
+    # (coingecko GETs), the subgraph POSTs are retried with backoff in `api` already
+    max_retries=Retry(total=5, backoff_factor=0.5, status_forcelist=[502, 503, 504]),
+)
+
+session = _Session()
+session.mount("https://", adapter)
+session.mount("http://", adapter)
+# urllib3 decodes br transparently as long as `Brotli` is installed
+session.headers.update({"Accept-Encoding": "gzip, deflate, br"})
+
+
+def post(url: str, **kwargs) -> requests.Response:
+    return session.post(url, **kwargs)
+
+
+def get(url: str, **kwargs) -> requests.Response:
+    return session.get(url, **kwargs)
+
+
+def coingecko() -> CoinGeckoAPI:
+    """coingecko client which sends its requests through the shared session"""
+    cg = CoinGeckoAPI()
+    cg.session = session
+    cg.request_timeout = timeout
+    return cg
+
+
+def connection_stats() -> dict:
+    """number of connections opened vs. requests which reused an open connection"""
+    opened, sent = 0, 0
+    for key in adapter.poolmanager.pools.keys():
+        pool = adapter.poolmanager.pools[key]
+        opened += pool.num_connections
+        sent += pool.num_requests
+
+    return {"opened": opened, "reused": sent - opened}